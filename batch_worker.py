@@ -0,0 +1,151 @@
+import os
+import json
+import math
+import time
+import uuid
+import logging
+import threading
+from azure.storage.queue import QueueClient, TextBase64EncodePolicy
+from models import BatchCheckRequest, BackgroundCheckRequest
+from db_operations import (create_batch, get_batch, claim_batch_items, complete_batch_items, touch_batch,
+                           claim_stalled_batches, reserve_user_credits, settle_user_credits)
+from tusdatos_client import launch_checks, charged_checks, upstream_available, VALID_DOC_TYPES
+
+# Storage queue that drives the batch worker
+BATCH_QUEUE_NAME = os.environ.get("BATCH_QUEUE_NAME", "backgroundcheck-batches")
+# Checks launched per queue message
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", 50))
+# Upper bound of the launch rate of a batch worker
+BATCH_LAUNCHES_PER_SECOND = float(os.environ.get("BATCH_LAUNCHES_PER_SECOND", 5))
+# Items claimed by a worker that did not finish within this time are launched again
+BATCH_LEASE_SECONDS = float(os.environ.get("BATCH_LEASE_SECONDS", 600))
+# Wait before re-checking a batch whose remaining items are all claimed by another worker
+BATCH_IDLE_SECONDS = float(os.environ.get("BATCH_IDLE_SECONDS", 30))
+# Schedule of batchSweepTimer, which re-queues batches no worker touched for BATCH_LEASE_SECONDS
+BATCH_SWEEP_SCHEDULE = os.environ.get("BATCH_SWEEP_SCHEDULE", "0 */5 * * * *")
+
+VALID_COUNTRIES = {'CO', 'EC'}
+
+def validate_batch(batch: BatchCheckRequest) -> list:
+    """
+    Function to validate a batch before it is accepted.
+    Returns the list of validation errors, empty when the batch is valid.
+    """
+    errors = []
+    if batch.country not in VALID_COUNTRIES:
+        errors.append(f"Invalid country: {batch.country}. Must be one of {VALID_COUNTRIES}.")
+    if not batch.checks:
+        errors.append("At least one check is required.")
+    for position, check in enumerate(batch.checks):
+        if check.typedoc not in VALID_DOC_TYPES:
+            errors.append(f"checks[{position}]: Invalid document type: {check.typedoc}. Must be one of {VALID_DOC_TYPES}.")
+    return errors
+
+def submit_batch(user_id: int, batch: BatchCheckRequest) -> str:
+    """
+    Function to store a validated batch for asynchronous processing.
+    Returns the batch id.
+    """
+    batch_id = str(uuid.uuid4())
+    create_batch(batch_id, user_id, batch.country, batch.legal_representative,
+                 [check.model_dump() for check in batch.checks])
+    logging.info(f"Stored batch {batch_id} with {len(batch.checks)} checks for user {user_id}")
+    return batch_id
+
+_queue_client: QueueClient = None
+_queue_client_lock = threading.Lock()
+
+def get_batch_queue() -> QueueClient:
+    """
+    Return the client of BATCH_QUEUE_NAME, encoding messages in base64 like the queue bindings.
+    """
+    global _queue_client
+    if _queue_client is None:
+        with _queue_client_lock:
+            if _queue_client is None:
+                _queue_client = QueueClient.from_connection_string(
+                    os.environ["AzureWebJobsStorage"], BATCH_QUEUE_NAME, message_encode_policy=TextBase64EncodePolicy())
+    return _queue_client
+
+def batch_message(batch_id: str) -> str:
+    return json.dumps({'batch_id': batch_id})
+
+def enqueue_batch(batch_id: str, delay_seconds: float = 0):
+    """
+    Queue a batch message that becomes visible to the batch worker after delay_seconds.
+    (The queue output binding cannot delay a message.)
+    """
+    get_batch_queue().send_message(batch_message(batch_id), visibility_timeout=math.ceil(max(delay_seconds, 0)))
+
+def sweep_stalled_batches() -> int:
+    """
+    Function to re-queue the unfinished batches that no worker has touched for BATCH_LEASE_SECONDS.
+    Returns the number of batches queued.
+    """
+    batch_ids = claim_stalled_batches(BATCH_LEASE_SECONDS)
+    for batch_id in batch_ids:
+        enqueue_batch(batch_id)
+    if batch_ids:
+        logging.warning(f"Re-queued {len(batch_ids)} stalled batches: {batch_ids}")
+    return len(batch_ids)
+
+def process_batch_chunk(batch_id: str) -> float:
+    """
+    Function to launch the next chunk of a batch, reserving credits for it.
+    Returns the seconds to wait before the next chunk is processed, or None when the batch
+    has no checks left to launch.
+    """
+    batch = get_batch(batch_id)
+    if batch is None:
+        logging.error(f"Batch {batch_id} not found")
+        return None
+
+    if not upstream_available():
+        # Leave the items queued instead of failing them while tusdatos is down
+        logging.warning(f"Batch {batch_id}: tusdatos circuit is open, retrying later")
+        touch_batch(batch_id)
+        return BATCH_IDLE_SECONDS
+
+    items = claim_batch_items(batch_id, BATCH_CHUNK_SIZE, BATCH_LEASE_SECONDS)
+    if not items:
+        # Any remaining items are being launched by another worker
+        return BATCH_IDLE_SECONDS if complete_batch_items(batch_id, []) else None
+
+    started = time.monotonic()
+    user_id = batch['userid']
+    checks = [BackgroundCheckRequest(**item['payload']) for item in items]
+    reserved = reserve_user_credits(user_id, len(checks))
+
+    results = []
+    try:
+        # The checks are stored linked to their items, so they are not launched again if this
+        # worker dies before complete_batch_items
+        results = launch_checks(user_id, checks[:reserved], batch_id=batch_id,
+                                batch_positions=[item['position'] for item in items[:reserved]])
+    finally:
+        settle_user_credits(user_id, reserved, charged_checks(results))
+
+    updates = []
+    for item, result in zip(items, results):
+        if result['not_sent']:
+            # The circuit opened (or tusdatos was unreachable) partway through the chunk:
+            # requeue the item so a later message launches it
+            status = 'pendiente'
+        elif result['id'] is not None and result['status'] != 'error':
+            status = 'lanzado'
+        else:
+            status = 'error'
+        updates.append({'position': item['position'], 'status': status, 'checkid': result['id']})
+    for item in items[len(results):]:
+        updates.append({'position': item['position'], 'status': 'sin_creditos', 'checkid': None})
+    remaining = complete_batch_items(batch_id, updates)
+    not_sent = sum(1 for result in results if result['not_sent'])
+    logging.info(f"Batch {batch_id}: launched {len(results) - not_sent} of {len(items)} claimed checks, "
+                 f"requeued {not_sent}, remaining: {remaining}")
+    if not remaining:
+        return None
+    if not_sent:
+        return BATCH_IDLE_SECONDS
+
+    # Keep the launch rate under BATCH_LAUNCHES_PER_SECOND
+    return max(len(results) / BATCH_LAUNCHES_PER_SECOND - (time.monotonic() - started), 0)
@@ -0,0 +1,229 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logging.basicConfig(level=logging.INFO)
+
+# Defaults of the simulated upstream behaviour, overridable from the command line
+MOCK_LATENCY_MS = float(os.environ.get("MOCK_LATENCY_MS", 50))
+MOCK_JITTER_MS = float(os.environ.get("MOCK_JITTER_MS", 20))
+# Fraction of calls answered with a 500, and with a 429 (with Retry-After: 1)
+MOCK_ERROR_RATE = float(os.environ.get("MOCK_ERROR_RATE", 0))
+MOCK_THROTTLE_RATE = float(os.environ.get("MOCK_THROTTLE_RATE", 0))
+# Seconds until a launched job is reported as finalizado
+MOCK_JOB_SECONDS = float(os.environ.get("MOCK_JOB_SECONDS", 5))
+# Fraction of launches answered with a finished result instead of a job id (cached upstream)
+MOCK_CACHED_RATE = float(os.environ.get("MOCK_CACHED_RATE", 0))
+MOCK_REPORT_KB = int(os.environ.get("MOCK_REPORT_KB", 256))
+
+class MockState:
+    """
+    Jobs launched against the mock and the behaviour settings of the server.
+    Job outcomes are derived from the document number so runs are reproducible.
+    """
+    def __init__(self, latency_ms=MOCK_LATENCY_MS, jitter_ms=MOCK_JITTER_MS, error_rate=MOCK_ERROR_RATE,
+                 throttle_rate=MOCK_THROTTLE_RATE, job_seconds=MOCK_JOB_SECONDS, cached_rate=MOCK_CACHED_RATE,
+                 report_kb=MOCK_REPORT_KB):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.job_seconds = job_seconds
+        self.cached_rate = cached_rate
+        self.report_kb = report_kb
+        self.jobs = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def count(self, endpoint: str):
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def add_job(self, payload: dict) -> dict:
+        job = {
+            "jobid": str(uuid.uuid4()),
+            "result_id": uuid.uuid4().hex[:24],
+            "doc": str(payload.get("doc", "")),
+            "typedoc": payload.get("typedoc"),
+            "created": time.monotonic(),
+        }
+        with self.lock:
+            self.jobs[job["jobid"]] = job
+        return job
+
+    def get_job(self, jobid: str) -> dict:
+        with self.lock:
+            return self.jobs.get(jobid)
+
+    def find_result(self, result_id: str) -> dict:
+        with self.lock:
+            return next((job for job in self.jobs.values() if job["result_id"] == result_id), None)
+
+def findings_for(doc: str) -> dict:
+    """
+    Deterministic hallazgos of a document: about a third of documents have findings.
+    """
+    seed = int(hashlib.sha256(doc.encode("utf-8")).hexdigest()[:8], 16)
+    if seed % 3:
+        return {"altos": [], "medios": [], "bajos": []}
+    return {
+        "altos": [{"fuente": "ofac", "descripcion": "Coincidencia en lista"}] * (seed % 2),
+        "medios": [{"fuente": "procuraduria", "descripcion": "Antecedente"}] * (seed % 4),
+        "bajos": [{"fuente": "rues", "descripcion": "Registro mercantil"}] * (seed % 5),
+    }
+
+def status_payload(job: dict, finished: bool) -> dict:
+    hallazgos = findings_for(job["doc"])
+    level = next((name[:-1] for name in ("altos", "medios", "bajos") if hallazgos[name]), "")
+    return {
+        "cedula": int(job["doc"]) if job["doc"].isdigit() else 0,
+        "error": False,
+        "estado": "finalizado" if finished else "procesando",
+        "hallazgo": bool(level),
+        "hallazgos": level,
+        "id": job["result_id"] if finished else None,
+        "typedoc": job["typedoc"],
+        "time": round(time.monotonic() - job["created"], 2),
+    }
+
+def report_body(result_id: str, size_kb: int, html: bool) -> bytes:
+    if html:
+        header = f"<html><body><h1>Reporte {result_id}</h1><pre>".encode("utf-8")
+        footer = b"</pre></body></html>"
+    else:
+        header = f"%PDF-1.4\n% Reporte {result_id}\n".encode("utf-8")
+        footer = b"\n%%EOF\n"
+    filler = max(size_kb * 1024 - len(header) - len(footer), 0)
+    return header + (b"0123456789abcdef" * (filler // 16 + 1))[:filler] + footer
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    tusdatos endpoints used by tusdatos_client. Paths are accepted with or without the /api prefix.
+    """
+    state: MockState = None
+    protocol_version = "HTTP/1.1"
+
+    ROUTES = [
+        ("POST", re.compile(r"^(?:/api)?/launch$"), "launch"),
+        ("GET", re.compile(r"^(?:/api)?/results/([^/]+)$"), "results"),
+        ("GET", re.compile(r"^(?:/api)?/report_json/([^/]+)$"), "report_json"),
+        ("GET", re.compile(r"^(?:/api)?/v2/(?:report_pdf|report_nit_pdf)/([^/]+)$"), "report_pdf"),
+        ("GET", re.compile(r"^(?:/api)?/v2/report/([^/]+)$"), "report_html"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method: str):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        for route_method, pattern, name in self.ROUTES:
+            match = pattern.match(self.path.split("?")[0])
+            if route_method == method and match:
+                break
+        else:
+            return self.send_json(404, {"detail": "Not Found"})
+
+        state = self.state
+        state.count(name)
+        time.sleep(max(random.gauss(state.latency_ms, state.jitter_ms), 0) / 1000)
+        roll = random.random()
+        if roll < state.throttle_rate:
+            return self.send_json(429, {"detail": "Too Many Requests"}, {"Retry-After": "1"})
+        if roll < state.throttle_rate + state.error_rate:
+            return self.send_json(500, {"detail": "Internal Server Error"})
+
+        getattr(self, f"handle_{name}")(*match.groups(), body=body)
+
+    def handle_launch(self, body: bytes):
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return self.send_json(422, {"detail": "Invalid JSON"})
+        job = self.state.add_job(payload)
+        response = {"email": "mock@tusdatos.co", "doc": job["doc"], "nombre": "PERSONA DE PRUEBA",
+                    "typedoc": job["typedoc"], "validado": True}
+        if random.random() < self.state.cached_rate:
+            job["created"] -= self.state.job_seconds
+            response["id"] = job["result_id"]
+        else:
+            response["jobid"] = job["jobid"]
+        self.send_json(200, response)
+
+    def handle_results(self, jobid: str, body: bytes):
+        job = self.state.get_job(jobid)
+        if job is None:
+            return self.send_json(404, {"detail": "Job not found"})
+        finished = time.monotonic() - job["created"] >= self.state.job_seconds
+        self.send_json(200, status_payload(job, finished))
+
+    def handle_report_json(self, result_id: str, body: bytes):
+        job = self.state.find_result(result_id)
+        doc = job["doc"] if job else result_id
+        self.send_json(200, {"id": result_id, "documento": doc, "dict_hallazgos": findings_for(doc),
+                             "resultados": {f"fuente_{i}": False for i in range(40)}})
+
+    def handle_report_pdf(self, result_id: str, body: bytes):
+        self.send_bytes(200, report_body(result_id, self.state.report_kb, html=False), "application/pdf")
+
+    def handle_report_html(self, result_id: str, body: bytes):
+        self.send_bytes(200, report_body(result_id, self.state.report_kb, html=True), "text/html")
+
+    def send_json(self, status: int, data: dict, headers: dict = None):
+        self.send_bytes(status, json.dumps(data).encode("utf-8"), "application/json", headers)
+
+    def send_bytes(self, status: int, data: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_mock_server(state: MockState = None, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Start the mock server in a daemon thread. With port=0 a free port is picked,
+    see server.server_address.
+    """
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state or MockState()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local fake of the tusdatos API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=MOCK_LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=MOCK_JITTER_MS)
+    parser.add_argument("--error-rate", type=float, default=MOCK_ERROR_RATE)
+    parser.add_argument("--throttle-rate", type=float, default=MOCK_THROTTLE_RATE)
+    parser.add_argument("--job-seconds", type=float, default=MOCK_JOB_SECONDS)
+    parser.add_argument("--cached-rate", type=float, default=MOCK_CACHED_RATE)
+    parser.add_argument("--report-kb", type=int, default=MOCK_REPORT_KB)
+    args = parser.parse_args()
+
+    state = MockState(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate,
+                      args.job_seconds, args.cached_rate, args.report_kb)
+    server = ThreadingHTTPServer((args.host, args.port), type("BoundMockHandler", (MockHandler,), {"state": state}))
+    logging.info(f"Mock tusdatos listening on http://{args.host}:{args.port} (set TUSDATOS_API_BASE_URL to it)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        sys.exit(0)
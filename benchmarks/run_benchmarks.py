@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import tempfile
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_tusdatos import MockState, start_mock_server
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the function_app handlers against a mock tusdatos")
+    parser.add_argument("--tusdatos-url", help="Use an already running tusdatos (or mock) instead of starting one")
+    parser.add_argument("--requests", type=int, default=20, help="backgroundCheck calls")
+    parser.add_argument("--batch-size", type=int, default=10, help="Checks per backgroundCheck call")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent handler calls")
+    parser.add_argument("--page-size", type=int, default=50, help="getUserChecks page size")
+    parser.add_argument("--list-rounds", type=int, default=10, help="Full getUserChecks pagings")
+    parser.add_argument("--reports", type=int, default=20, help="Checks whose PDF and HTML reports are fetched")
+    parser.add_argument("--sync-timeout", type=float, default=120, help="Seconds to wait for every check to finalize")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Mock upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    parser.add_argument("--job-seconds", type=float, default=2, help="Mock time until a job is finalizado")
+    parser.add_argument("--report-kb", type=int, default=256)
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    return parser.parse_args()
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(q / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def summarize(name: str, latencies: list, wall: float, errors: int = 0, units: int = None) -> dict:
+    """
+    Throughput (calls, and units such as checks or pages, per second) and latency
+    percentiles in milliseconds of one scenario.
+    """
+    values = sorted(latencies)
+    return {
+        "scenario": name,
+        "calls": len(values),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "calls_per_s": round(len(values) / wall, 2) if wall else 0,
+        "units_per_s": round((units if units is not None else len(values)) / wall, 2) if wall else 0,
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "max_ms": round(values[-1] * 1000, 1) if values else 0,
+    }
+
+def run_concurrently(calls: list, concurrency: int):
+    """
+    Run the (fn, kwargs) calls on `concurrency` threads.
+    Returns the (latency, result) of every call and the wall time.
+    """
+    def timed(call):
+        fn, kwargs = call
+        started = time.perf_counter()
+        result = fn(**kwargs)
+        return time.perf_counter() - started, result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(timed, calls))
+    return samples, time.perf_counter() - started
+
+def http_request(method: str, route: str, body: dict = None, params: dict = None, route_params: dict = None):
+    import azure.functions as func
+    return func.HttpRequest(
+        method=method, url=f"/api/{route}",
+        headers={"Content-Type": "application/json"},
+        params=params or {}, route_params=route_params or {},
+        body=json.dumps(body).encode("utf-8") if body is not None else b"")
+
+def handler(function_app, name: str):
+    """
+    The plain Python function behind a decorated Azure Functions handler.
+    """
+    return getattr(function_app, name).build().get_user_function()
+
+def bench_background_check(function_app, user_id: int, args) -> dict:
+    background_check = handler(function_app, "backgroundCheck")
+    calls = []
+    for _ in range(args.requests):
+        checks = [{"typedoc": "CC", "doc": str(random.randint(10_000_000, 99_999_999))} for _ in range(args.batch_size)]
+        calls.append((background_check, {"req": http_request("POST", "backgroundCheck", {"user_id": user_id, "checks": checks})}))
+    samples, wall = run_concurrently(calls, args.concurrency)
+    errors = sum(1 for _, response in samples if response.status_code != 200)
+    return summarize("backgroundCheck", [latency for latency, _ in samples], wall, errors, units=args.requests * args.batch_size)
+
+def bench_sync(function_app, user_id: int, args) -> dict:
+    from db_operations import get_processing_status
+
+    sync_timer = handler(function_app, "backgroundCheckSyncTimer")
+    time.sleep(args.job_seconds)
+    latencies = []
+    started = time.perf_counter()
+    while time.perf_counter() - started < args.sync_timeout:
+        cycle_started = time.perf_counter()
+        sync_timer(timer=SimpleNamespace(past_due=False))
+        latencies.append(time.perf_counter() - cycle_started)
+        if not get_processing_status(user_id):
+            break
+        time.sleep(1)
+    else:
+        logging.warning(f"Checks of user {user_id} still processing after {args.sync_timeout}s")
+    return summarize("sync cycle", latencies, time.perf_counter() - started,
+                     errors=1 if get_processing_status(user_id) else 0, units=args.requests * args.batch_size)
+
+def bench_listing(function_app, user_id: int, args) -> dict:
+    get_user_checks = handler(function_app, "getUserChecks")
+    latencies = []
+    errors = 0
+    pages = 0
+
+    def page_through():
+        nonlocal errors, pages
+        cursor = None
+        while True:
+            params = {"limit": str(args.page_size)}
+            if cursor:
+                params["cursor"] = cursor
+            started = time.perf_counter()
+            response = get_user_checks(req=http_request("GET", f"getUserChecks/{user_id}", params=params,
+                                                         route_params={"user_id": str(user_id)}))
+            latencies.append(time.perf_counter() - started)
+            pages += 1
+            if response.status_code != 200:
+                errors += 1
+                return
+            cursor = json.loads(response.get_body()).get("next_cursor")
+            if not cursor:
+                return
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(lambda _: page_through(), range(args.list_rounds)))
+    return summarize("getUserChecks page", latencies, time.perf_counter() - started, errors, units=pages)
+
+def bench_reports(function_app, user_id: int, args) -> list:
+    from db_operations import get_user_checks_page
+
+    checks, _ = get_user_checks_page(user_id, args.reports, status="finalizado")
+    report_handlers = [("pdf", handler(function_app, "getCheckReport_pdf")),
+                       ("html", handler(function_app, "getCheckReport_html"))]
+    summaries = []
+    # The first pass fills the report cache from the provider, the second one is served from it
+    for phase in ("cold", "warm"):
+        for fmt, report_handler in report_handlers:
+            calls = [(report_handler, {"req": http_request("GET", f"getCheckReport_{fmt}/{check['id']}",
+                                                           route_params={"check_id": str(check['id'])})})
+                     for check in checks]
+            samples, wall = run_concurrently(calls, args.concurrency)
+            errors = sum(1 for _, response in samples if response.status_code != 200)
+            summaries.append(summarize(f"report {fmt} ({phase})", [latency for latency, _ in samples], wall, errors))
+    return summaries
+
+def print_table(results: list):
+    columns = ["scenario", "calls", "errors", "wall_s", "calls_per_s", "units_per_s", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in results)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for result in results:
+        print("  ".join(str(result[c]).ljust(widths[c]) for c in columns))
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.tusdatos_url:
+        os.environ["TUSDATOS_API_BASE_URL"] = args.tusdatos_url
+    else:
+        state = MockState(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate,
+                          args.job_seconds, 0, args.report_kb)
+        server = start_mock_server(state)
+        os.environ["TUSDATOS_API_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/api"
+    # Settings are read at import time, so they must be in place before importing the app.
+    # The client rate limit is off by default to measure the service itself; export it to include it.
+    os.environ.setdefault("TUSDATOS_RATE_LIMIT", "0")
+    os.environ.setdefault("REPORT_CACHE_DIR", tempfile.mkdtemp(prefix="sampink_bench_reports_"))
+
+    import function_app
+    from migrate import apply_migrations
+    from db_operations import create_user, update_user_credits_counter
+
+    apply_migrations()
+    user_id = create_user(f"bench-{uuid.uuid4().hex[:12]}")
+    update_user_credits_counter(user_id, args.requests * args.batch_size, 0)
+    logging.warning(f"Benchmarking as user {user_id} against {os.environ['TUSDATOS_API_BASE_URL']}")
+
+    results = [
+        bench_background_check(function_app, user_id, args),
+        bench_sync(function_app, user_id, args),
+        bench_listing(function_app, user_id, args),
+    ]
+    results.extend(bench_reports(function_app, user_id, args))
+    print_table(results)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"args": vars(args), "user_id": user_id, "results": results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,176 +1,766 @@
 import psycopg2
 import json
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import os
 from dotenv import load_dotenv
 from psycopg2.extensions import connection
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 import traceback
+import logging
+import threading
+import time
+import base64
+from datetime import date, datetime
+from payload_store import compress_payload, load_payload
+from findings import extract_findings
+from user_cache import get_user_cache
 
 load_dotenv('.env')
 
-def connect_db()-> connection:
+def _conn_string() -> str:
     POSTGRES_REMOTE_ENDPOINT = os.environ['PGHOST']
     POSTGRES_REMOTE_USER = os.environ['PGUSER']
     POSTGRES_REMOTE_PASSWORD = os.environ['PGPASSWORD']
     POSTGRES_DB_NAME = os.environ['PGDATABASE']
-    sslmode = "require"
+    sslmode = os.environ.get('PGSSLMODE', "require")
     # logging.info(f"Env: {POSTGRES_REMOTE_ENDPOINT},{POSTGRES_DB_NAME},{POSTGRES_REMOTE_USER}")
-    conn_string = f"host={POSTGRES_REMOTE_ENDPOINT} user={POSTGRES_REMOTE_USER} dbname={POSTGRES_DB_NAME} password={POSTGRES_REMOTE_PASSWORD} sslmode={sslmode}"
+    return f"host={POSTGRES_REMOTE_ENDPOINT} user={POSTGRES_REMOTE_USER} dbname={POSTGRES_DB_NAME} password={POSTGRES_REMOTE_PASSWORD} sslmode={sslmode}"
 
-    conn: connection = psycopg2.connect(conn_string, cursor_factory=RealDictCursor)
+def connect_db()-> connection:
+    conn: connection = psycopg2.connect(_conn_string(), cursor_factory=RealDictCursor)
     return conn
 
-# Function to save a request
-def save_backgroundCheck_request(userid: int, document: str, typedoc: str, payload: dict, jobid:str, status: str , response_code:int, response_content:str) -> int:
-    conn = connect_db()
+# Connection pool configuration
+PGPOOL_MINCONN = int(os.environ.get('PGPOOL_MINCONN', 1))
+PGPOOL_MAXCONN = int(os.environ.get('PGPOOL_MAXCONN', 10))
+PGPOOL_TIMEOUT = float(os.environ.get('PGPOOL_TIMEOUT', 30))
+# Connections idle for longer than this are pinged before being handed out
+PGPOOL_HEALTHCHECK_IDLE = float(os.environ.get('PGPOOL_HEALTHCHECK_IDLE', 30))
+PGPOOL_CHECKOUT_RETRIES = 3
+
+_pool: ThreadedConnectionPool = None
+_pool_slots: threading.BoundedSemaphore = None
+_pool_lock = threading.Lock()
+_last_used = {}
+
+def get_pool() -> ThreadedConnectionPool:
+    """
+    Return the process-wide connection pool, creating it on first use.
+    """
+    global _pool, _pool_slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool_slots = threading.BoundedSemaphore(PGPOOL_MAXCONN)
+                _pool = ThreadedConnectionPool(PGPOOL_MINCONN, PGPOOL_MAXCONN,
+                                               _conn_string(), cursor_factory=RealDictCursor)
+                logging.info(f"Created PostgreSQL pool (min={PGPOOL_MINCONN}, max={PGPOOL_MAXCONN})")
+    return _pool
+
+def _is_healthy(conn: connection) -> bool:
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < PGPOOL_HEALTHCHECK_IDLE:
+        return True
     try:
         with conn.cursor() as cursor:
-            cursor.execute(
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+def get_connection() -> connection:
+    """
+    Check out a connection from the pool, blocking while all connections are in use.
+    Broken connections are discarded and replaced with fresh ones.
+    """
+    pool = get_pool()
+    if not _pool_slots.acquire(timeout=PGPOOL_TIMEOUT):
+        raise PoolError(f"Timed out after {PGPOOL_TIMEOUT}s waiting for a database connection")
+    try:
+        for attempt in range(PGPOOL_CHECKOUT_RETRIES):
+            conn = pool.getconn()
+            if _is_healthy(conn):
+                return conn
+            logging.warning(f"Discarding broken pooled connection (attempt {attempt + 1}/{PGPOOL_CHECKOUT_RETRIES})")
+            _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError("Could not obtain a healthy database connection")
+    except Exception:
+        _pool_slots.release()
+        raise
+
+def release_connection(conn: connection):
+    """
+    Return a connection to the pool, rolling back any open transaction.
+    """
+    broken = conn.closed
+    if not broken:
+        try:
+            conn.rollback()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+    if broken:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    try:
+        get_pool().putconn(conn, close=broken)
+    finally:
+        _pool_slots.release()
+
+# Function to save several requests in a single statement
+def save_backgroundCheck_requests(records: list) -> list:
+    """
+    Insert a list of request records in one multi-row INSERT inside one transaction.
+    Each record is a dict with userid, document, typedoc, payload, jobid, status, response_code,
+    response_content, an optional result_id and, for checks launched from a batch, the batch_id
+    and batch_position of their item.
+    If the batch INSERT fails the records are inserted one by one, so a bad record does not
+    drop the others. Returns the new ids in the same order as the input records, None for
+    the records that could not be saved.
+    """
+    if not records:
+        return []
+    values = [
+        (position, r['userid'], r['document'], r['typedoc'], json.dumps(r['payload']), r['jobid'], r['status'],
+         r['response_code'], r['response_content'], r.get('result_id'), r.get('batch_id'), r.get('batch_position'))
+        for position, r in enumerate(records)
+    ]
+    template = ("(%s, %s::integer, %s::varchar, %s::varchar, %s::jsonb, %s::varchar, %s::varchar, %s::integer, %s::text, %s::varchar,"
+                " %s::varchar, %s::integer)")
+    query = """
+        INSERT INTO backgroundcheck_requests (userid, document, typedoc, payload, jobid, status, timestamp, response_code, response_content, result_id,
+                                              batch_id, batch_position)
+        SELECT userid, document, typedoc, payload, jobid, status, NOW(), response_code, response_content, result_id, batch_id, batch_position
+        FROM (VALUES %s) AS v(position, userid, document, typedoc, payload, jobid, status, response_code, response_content, result_id,
+                              batch_id, batch_position)
+        ORDER BY position
+        RETURNING id
+        """
+    conn = get_connection()
+    try:
+        try:
+            with conn.cursor() as cursor:
+                # Rows are inserted (and their SERIAL ids drawn) following ORDER BY position,
+                # so the sorted ids line up with the input order.
+                rows = execute_values(cursor, query, values, template=template, page_size=len(values), fetch=True)
+            conn.commit()
+            return sorted(row["id"] for row in rows)
+        except psycopg2.Error as e:
+            conn.rollback()
+            logging.error(f"Batch insert of {len(values)} requests failed, inserting them one by one: {e}")
+
+        ids = []
+        for value, record in zip(values, records):
+            try:
+                with conn.cursor() as cursor:
+                    rows = execute_values(cursor, query, [value], template=template, fetch=True)
+                conn.commit()
+                ids.append(rows[0]["id"])
+            except psycopg2.Error as e:
+                conn.rollback()
+                logging.error(f"Could not save the request of document {record['document']} (jobid {record['jobid']}): {e}")
+                ids.append(None)
+        return ids
+    finally:
+        release_connection(conn)
+
+# Function to save several responses in a single statement
+def save_backgroundCheck_results(results: list) -> int:
+    """
+    Insert a list of results in one multi-row INSERT inside one transaction.
+    Each result is a dict with check_id, document, jobid, hallazgos_altos, hallazgos_medios,
+    hallazgos_bajos and response_payload. Checks that already have results are skipped.
+    Returns the number of inserted rows.
+    """
+    if not results:
+        return 0
+    values = [
+        (r['check_id'], r['document'], r['jobid'], r['hallazgos_altos'], r['hallazgos_medios'],
+         r['hallazgos_bajos'], psycopg2.Binary(compress_payload(r['response_payload'])))
+        for r in results
+    ]
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            inserted = execute_values(
+                cursor,
                 """
-                INSERT INTO backgroundcheck_requests (userid, document, typedoc, payload, jobid, status, timestamp, response_code, response_content)
-                VALUES (%s, %s, %s, %s, %s, %s, NOW(), %s, %s)
-                RETURNING id
+                INSERT INTO backgroundcheck_results (checkid, document, jobid, hallazgos_altos, hallazgos_medios, hallazgos_bajos, response_payload_gz, timestamp)
+                VALUES %s
+                ON CONFLICT (checkid) DO NOTHING
+                RETURNING id, checkid
                 """,
-                (userid, document, typedoc, json.dumps(payload), jobid, status, response_code, response_content)
+                values,
+                template="(%s, %s, %s, %s, %s, %s, %s, NOW())",
+                page_size=len(values),
+                fetch=True
             )
-            request_id = cursor.fetchone()["id"]
+            # Findings are only extracted for the results actually inserted
+            _save_findings(cursor, inserted, {r['check_id']: r['response_payload'] for r in results})
         conn.commit()
-        return request_id
+        return len(inserted)
     finally:
-        conn.close()
+        release_connection(conn)
+
+def _save_findings(cursor, inserted_results: list, payloads: dict) -> int:
+    """
+    Extract the findings of newly inserted results and insert them in the current transaction.
+    `inserted_results` are the (id, checkid) rows of the results, `payloads` maps check ids to payloads.
+    """
+    values = []
+    for row in inserted_results:
+        try:
+            findings = extract_findings(payloads.get(row["checkid"]))
+        except ValueError as e:
+            logging.error(f"Could not extract findings of check_id {row['checkid']}: {e}")
+            continue
+        values.extend(
+            (row["id"], row["checkid"], f["severity"], f["source"], f["description"],
+             json.dumps(f["detail"], ensure_ascii=False) if f["detail"] is not None else None)
+            for f in findings
+        )
+    if not values:
+        return 0
+    execute_values(
+        cursor,
+        """
+        INSERT INTO backgroundcheck_findings (resultid, checkid, userid, severity, source, description, detail)
+        SELECT v.resultid, v.checkid, r.userid, v.severity, v.source, v.description, v.detail
+        FROM (VALUES %s) AS v(resultid, checkid, severity, source, description, detail)
+        JOIN backgroundcheck_requests r ON r.id = v.checkid
+        """,
+        values,
+        template="(%s::integer, %s::integer, %s::varchar, %s::varchar, %s::text, %s::jsonb)",
+        page_size=1000
+    )
+    return len(values)
 
-# Function to save a response
-def save_backgroundCheck_result(check_id: int, doc: str, hallazgos_altos:int, hallazgos_medios: int, hallazgos_bajos: int, response_payload: dict):
-    conn = connect_db()
+def _load_user(user_id: int) -> dict:
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
-            # Get the request_id from the requests table where jobid matches
             cursor.execute(
                 """
-                SELECT document, jobid  FROM backgroundcheck_requests WHERE id = %s
+                SELECT id, username, credits, request_counter FROM backgroundcheck_user WHERE id = %s
                 """,
-                (check_id,)
+                (user_id,)
             )
             result = cursor.fetchone()
-            if not result:
-                raise ValueError(f"No request found with checkid {check_id}")
-            
-            doc = result["document"]
-            job_id = result["jobid"]
+            return dict(result) if result else None
+    finally:
+        release_connection(conn)
+
+def get_user_record(user_id: int) -> dict:
+    """
+    Return the id, username, credits and request_counter of a user through the user cache.
+    Raises ValueError when the user does not exist.
+    """
+    record = get_user_cache().get_or_load(user_id, lambda: _load_user(user_id))
+    if record is None:
+        raise ValueError(f"No user found with id {user_id}")
+    return record
 
-            # Insert the response into the responses table
+def invalidate_user(user_id: int):
+    get_user_cache().invalidate(user_id)
+
+def update_user_credits_counter(user_id: int, credits: int, counter:int) -> bool:
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
             cursor.execute(
                 """
-                INSERT INTO backgroundcheck_results (checkid, document, jobid, hallazgos_altos, hallazgos_medios, hallazgos_bajos, response_payload, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+                UPDATE backgroundcheck_user SET credits = %s, request_counter = %s WHERE id = %s
                 """,
-                (check_id, doc, job_id, hallazgos_altos, hallazgos_medios, hallazgos_bajos, json.dumps(response_payload))
+                (credits, counter, user_id)
             )
+            if cursor.rowcount == 0:
+                return False  # No rows were updated, user might not exist
         conn.commit()
+        invalidate_user(user_id)
+        return True  # Successfully updated credits
     finally:
-        conn.close()
+        release_connection(conn)
 
-def get_user_credits_counter(user_id: int) -> int:
-    conn = connect_db()
+def reserve_user_credits(user_id: int, requested: int) -> int:
+    """
+    Atomically take up to `requested` credits from the user's balance.
+    Returns the number of credits actually reserved.
+    """
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
                 """
-                SELECT credits, request_counter FROM backgroundcheck_user WHERE id = %s
+                WITH cur AS (
+                    SELECT id, LEAST(GREATEST(credits, 0), %s) AS reserved
+                    FROM backgroundcheck_user WHERE id = %s
+                    FOR UPDATE
+                )
+                UPDATE backgroundcheck_user u
+                SET credits = u.credits - cur.reserved, request_counter = u.request_counter + cur.reserved
+                FROM cur
+                WHERE u.id = cur.id
+                RETURNING cur.reserved, u.credits
                 """,
-                (user_id,)
+                (requested, user_id)
             )
             result = cursor.fetchone()
-            if result:
-                return result["credits"], result["request_counter"]
-            else:
+            if not result:
                 raise ValueError(f"No user found with id {user_id}")
+        conn.commit()
+        invalidate_user(user_id)
+        return result["reserved"]
     finally:
-        conn.close()   
+        release_connection(conn)
 
-def update_user_credits_counter(user_id: int, credits: int, counter:int) -> bool:
-    conn = connect_db()
+def settle_user_credits(user_id: int, reserved: int, used: int) -> int:
+    """
+    Refund the reserved credits that were not used.
+    Returns the number of credits refunded.
+    """
+    refund = reserved - used
+    if refund <= 0:
+        return 0
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
                 """
-                UPDATE backgroundcheck_user SET credits = %s, request_counter = %s WHERE id = %s
+                UPDATE backgroundcheck_user SET credits = credits + %s, request_counter = request_counter - %s WHERE id = %s
                 """,
-                (credits, counter, user_id)
+                (refund, refund, user_id)
             )
-            if cursor.rowcount == 0:
-                return False  # No rows were updated, user might not exist
         conn.commit()
-        return True  # Successfully updated credits
+        invalidate_user(user_id)
+        return refund
     finally:
-        conn.close()
+        release_connection(conn)
 
-def get_pending_checks(user_id: int= None) -> list:
-    conn = connect_db()
+def find_recent_checks(user_id: int, keys: list, ttl_seconds: float) -> dict:
+    """
+    Find the most recent finalized check of the user for each (typedoc, document) key,
+    ignoring checks older than ttl_seconds.
+    Returns a dict mapping each found key to its check (id, jobid, result_id).
+    """
+    if not keys:
+        return {}
+    conn = get_connection()
     try:
-        if user_id:
-            query = """
-                SELECT * FROM backgroundcheck_requests WHERE userid = %s AND status = 'procesando'"""
-            params = (user_id,)
-        else:
-            query = """
-                SELECT * FROM backgroundcheck_requests WHERE status = 'procesando'"""
-            params = ()
-        
         with conn.cursor() as cursor:
-            cursor.execute(query, params)
-            return cursor.fetchall()
+            cursor.execute(
+                """
+                SELECT DISTINCT ON (r.typedoc, r.document) r.id, r.typedoc, r.document, r.jobid, r.result_id
+                FROM backgroundcheck_requests r
+                JOIN unnest(%s::varchar[], %s::varchar[]) AS k(typedoc, document)
+                    ON r.typedoc = k.typedoc AND r.document = k.document
+                WHERE r.userid = %s AND r.status = 'finalizado' AND r.result_id IS NOT NULL
+                AND r.timestamp >= NOW() - %s * INTERVAL '1 second'
+                ORDER BY r.typedoc, r.document, r.timestamp DESC
+                """,
+                ([typedoc for typedoc, _ in keys], [document for _, document in keys], user_id, ttl_seconds)
+            )
+            return {(row["typedoc"], row["document"]): row for row in cursor.fetchall()}
     finally:
-        conn.close()
+        release_connection(conn)
 
+def copy_check_results(pairs: list) -> int:
+    """
+    Copy the stored results of source checks, and their findings, to other checks, given
+    (source_id, target_id) pairs. Sources without stored results are skipped.
+    Returns the number of copied rows.
+    """
+    if not pairs:
+        return 0
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            copied = execute_values(
+                cursor,
+                """
+                INSERT INTO backgroundcheck_results (checkid, document, jobid, hallazgos_altos, hallazgos_medios, hallazgos_bajos, response_payload, response_payload_gz, timestamp)
+                SELECT v.target_id, res.document, res.jobid, res.hallazgos_altos, res.hallazgos_medios, res.hallazgos_bajos, res.response_payload, res.response_payload_gz, NOW()
+                FROM (VALUES %s) AS v(source_id, target_id)
+                JOIN backgroundcheck_results res ON res.checkid = v.source_id
+                ON CONFLICT (checkid) DO NOTHING
+                RETURNING id, checkid
+                """,
+                pairs,
+                template="(%s::integer, %s::integer)",
+                page_size=len(pairs),
+                fetch=True
+            )
+            if copied:
+                source_of = {target_id: source_id for source_id, target_id in pairs}
+                execute_values(
+                    cursor,
+                    """
+                    INSERT INTO backgroundcheck_findings (resultid, checkid, userid, severity, source, description, detail)
+                    SELECT v.resultid, v.checkid, r.userid, f.severity, f.source, f.description, f.detail
+                    FROM (VALUES %s) AS v(resultid, checkid, source_id)
+                    JOIN backgroundcheck_findings f ON f.checkid = v.source_id
+                    JOIN backgroundcheck_requests r ON r.id = v.checkid
+                    ORDER BY v.resultid, f.id
+                    """,
+                    [(row["id"], row["checkid"], source_of[row["checkid"]]) for row in copied],
+                    template="(%s::integer, %s::integer, %s::integer)",
+                    page_size=len(copied)
+                )
+        conn.commit()
+        return len(copied)
+    finally:
+        release_connection(conn)
 
-def get_user_checks(user_id: int) -> list:
-    conn = connect_db()
+def claim_due_checks(limit: int, lease_seconds: float) -> list:
+    """
+    Claim up to `limit` pending checks whose next poll is due.
+    Claimed rows are pushed `lease_seconds` into the future so concurrent workers skip them.
+    """
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
                 """
-                SELECT *, 
-                to_char(timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'America/Bogota', 'YYYY-MM-DD HH24:MI:SS') as timestamp 
-                FROM backgroundcheck_requests 
-                WHERE userid = %s
+                UPDATE backgroundcheck_requests
+                SET next_poll_at = NOW() + %s * INTERVAL '1 second'
+                WHERE id IN (
+                    SELECT id FROM backgroundcheck_requests
+                    WHERE status = 'procesando' AND (next_poll_at IS NULL OR next_poll_at <= NOW())
+                    ORDER BY next_poll_at NULLS FIRST, id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, userid, jobid, status, poll_failures, EXTRACT(EPOCH FROM NOW() - timestamp) AS age_seconds
                 """,
-                (user_id,)
+                (lease_seconds, limit)
             )
-            checks = [dict(row) for row in cursor.fetchall()]
+            checks = cursor.fetchall()
+        conn.commit()
+        return checks
+    finally:
+        release_connection(conn)
+
+# Summary columns of the check list view, the large payload/response columns are left
+# out and the hallazgo counts come from the same query.
+_CHECK_LIST_QUERY = """
+    SELECT r.id, r.userid, r.document, r.typedoc, r.jobid, r.status, r.response_code, r.result_id,
+    to_char(r.timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'America/Bogota', 'YYYY-MM-DD HH24:MI:SS') as timestamp,
+    r.timestamp AS sort_timestamp, r.status_xid::text::bigint AS status_xid, r.row_xid::text::bigint AS row_xid,
+    res.id IS NOT NULL AS has_results, res.hallazgos_altos, res.hallazgos_medios, res.hallazgos_bajos
+    FROM backgroundcheck_requests r
+    LEFT JOIN LATERAL (
+        SELECT id, hallazgos_altos, hallazgos_medios, hallazgos_bajos
+        FROM backgroundcheck_results
+        WHERE checkid = r.id AND r.status = 'finalizado'
+        LIMIT 1
+    ) res ON TRUE
+"""
+
+CHECK_SORT_OPTIONS = {'timestamp_desc', 'timestamp_asc'}
+
+def _check_list_row(row) -> dict:
+    check = dict(row)
+    check.pop("sort_timestamp")
+    check.pop("status_xid")
+    check.pop("row_xid")
+    if not check.pop("has_results"):
+        del check["hallazgos_altos"], check["hallazgos_medios"], check["hallazgos_bajos"]
+    return check
 
-            for check in checks:
-                if check["status"] == "finalizado":
-                    resuls = get_check_results(check["id"])
-                    if resuls:
-                        check["hallazgos_altos"] = resuls["hallazgos_altos"]
-                        check["hallazgos_medios"] = resuls["hallazgos_medios"]
-                        check["hallazgos_bajos"] = resuls["hallazgos_bajos"]
-                    else:
-                        pass
-            return checks
+def encode_checks_cursor(sort_timestamp, check_id: int) -> str:
+    raw = json.dumps({"ts": sort_timestamp.isoformat(), "id": check_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_checks_cursor(cursor: str) -> tuple:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return datetime.fromisoformat(data["ts"]), int(data["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def encode_change_cursor(xid: int, check_id: int = 0) -> str:
+    return f"{xid}.{check_id}"
+
+def decode_change_cursor(cursor: str) -> tuple:
+    """
+    Parse a change cursor into the (transaction id, check id) of the last change returned.
+    Cursors issued before changes were stamped with transaction ids (plain sequence
+    versions, without a dot) restart from the beginning.
+    """
+    xid, dot, check_id = cursor.partition(".")
+    try:
+        if not dot:
+            int(xid)
+            return 0, 0
+        return int(xid), int(check_id)
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def _change_horizon(cursor) -> int:
+    """
+    Oldest transaction still running: every change stamped with an older transaction id is
+    committed (or rolled back) and visible to the following statements.
+    """
+    cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS horizon")
+    return cursor.fetchone()["horizon"]
+
+def _get_check_changes(user_id: int, xid_column: str, since: str, limit: int) -> tuple:
+    """
+    Return the checks of a user whose `xid_column` change is after the `since` cursor and below
+    the horizon, oldest change first, the cursor of the next call and whether more changes follow.
+    """
+    since_xid, since_id = decode_change_cursor(since)
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            horizon = _change_horizon(cursor)
+            cursor.execute(
+                _CHECK_LIST_QUERY + f"""
+                WHERE r.userid = %s AND (r.{xid_column}, r.id) > (%s::xid8, %s) AND r.{xid_column} < %s::xid8
+                ORDER BY r.{xid_column}, r.id
+                LIMIT %s
+                """,
+                (user_id, str(since_xid), since_id, str(horizon), limit + 1)
+            )
+            rows = cursor.fetchall()
     finally:
-        conn.close()
+        release_connection(conn)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        next_cursor = encode_change_cursor(rows[-1][xid_column], rows[-1]["id"])
+    else:
+        # Everything below the horizon was returned, changes still in flight are at or above it
+        next_cursor = encode_change_cursor(max(horizon, since_xid))
+    return [_check_list_row(row) for row in rows], next_cursor, has_more
+
+def get_user_checks_page(user_id: int, limit: int, cursor: str = None, sort: str = 'timestamp_desc',
+                         status: str = None, typedoc: str = None, date_from: date = None, date_to: date = None,
+                         doc_prefix: str = None, has_high_findings: bool = None) -> tuple:
+    """
+    Return one page of a user's checks using keyset pagination on (timestamp, id).
+    Dates are calendar days in America/Bogota, date_to is inclusive.
+    Returns the checks and the cursor of the next page (None on the last page).
+    """
+    if sort not in CHECK_SORT_OPTIONS:
+        raise ValueError(f"Invalid sort: {sort}. Must be one of {CHECK_SORT_OPTIONS}.")
+    descending = sort == 'timestamp_desc'
 
-def update_check_status(check_id: int, status) -> bool:
-    conn = connect_db()
+    conditions = ["r.userid = %s"]
+    params = [user_id]
+    if status:
+        conditions.append("r.status = %s")
+        params.append(status)
+    if typedoc:
+        conditions.append("r.typedoc = %s")
+        params.append(typedoc)
+    if date_from:
+        conditions.append("r.timestamp >= (%s::date::timestamp AT TIME ZONE 'America/Bogota') AT TIME ZONE 'UTC'")
+        params.append(date_from)
+    if date_to:
+        conditions.append("r.timestamp < ((%s::date + 1)::timestamp AT TIME ZONE 'America/Bogota') AT TIME ZONE 'UTC'")
+        params.append(date_to)
+    if doc_prefix:
+        conditions.append("r.document LIKE %s")
+        params.append(doc_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    if has_high_findings is True:
+        conditions.append("res.hallazgos_altos > 0")
+    elif has_high_findings is False:
+        conditions.append("COALESCE(res.hallazgos_altos, 0) = 0")
+    if cursor:
+        conditions.append(f"(r.timestamp, r.id) {'<' if descending else '>'} (%s, %s)")
+        params.extend(decode_checks_cursor(cursor))
+
+    direction = "DESC" if descending else "ASC"
+    query = (_CHECK_LIST_QUERY + " WHERE " + " AND ".join(conditions) +
+             f" ORDER BY r.timestamp {direction}, r.id {direction} LIMIT %s")
+    params.append(limit + 1)
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+    finally:
+        release_connection(conn)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_checks_cursor(rows[-1]["sort_timestamp"], rows[-1]["id"])
+    return [_check_list_row(row) for row in rows], next_cursor
+
+def get_user_checks_since(user_id: int, since: str, limit: int) -> tuple:
+    """
+    Return the checks of a user inserted or changed (including their results) after the `since` cursor,
+    oldest change first, the cursor to pass as `since` next time and whether more changes follow.
+    """
+    return _get_check_changes(user_id, "row_xid", since, limit)
+
+def get_user_checks_version(user_id: int) -> tuple:
+    """
+    Return the latest change of a user's checks below the horizon (0 when there is none), which
+    changes whenever a check of the user or its result is inserted or changed, and the `since`
+    cursor from which later changes are returned.
+    """
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
+            horizon = _change_horizon(cursor)
             cursor.execute(
                 """
-                UPDATE backgroundcheck_requests SET status = %s WHERE id = %s
+                SELECT row_xid::text::bigint AS version FROM backgroundcheck_requests
+                WHERE userid = %s AND row_xid < %s::xid8
+                ORDER BY row_xid DESC
+                LIMIT 1
                 """,
-                (status, check_id)
+                (user_id, str(horizon))
             )
-            if cursor.rowcount == 0:
-                return False  # No rows were updated, check might not exist
+            row = cursor.fetchone()
+            return (row["version"] if row else 0), encode_change_cursor(horizon)
+    finally:
+        release_connection(conn)
+
+def get_user_stats(user_id: int, date_from: date = None, date_to: date = None) -> dict:
+    """
+    Return a user's check counts per status and typedoc, hallazgo totals and per-day counts
+    from the precomputed summary table. Dates are calendar days in America/Bogota, date_to is inclusive.
+    """
+    conditions = ["userid = %s"]
+    params = [user_id]
+    if date_from:
+        conditions.append("day >= %s")
+        params.append(date_from)
+    if date_to:
+        conditions.append("day <= %s")
+        params.append(date_to)
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT day, typedoc, status, checks, hallazgos_altos, hallazgos_medios, hallazgos_bajos "
+                "FROM backgroundcheck_user_stats WHERE " + " AND ".join(conditions) + " ORDER BY day",
+                params
+            )
+            rows = cursor.fetchall()
+    finally:
+        release_connection(conn)
+
+    stats = {"total_checks": 0, "by_status": {}, "by_typedoc": {},
+             "hallazgos": {"altos": 0, "medios": 0, "bajos": 0}, "daily": []}
+    for row in rows:
+        day = row["day"].isoformat()
+        if not stats["daily"] or stats["daily"][-1]["day"] != day:
+            stats["daily"].append({"day": day, "checks": 0, "hallazgos_altos": 0, "hallazgos_medios": 0, "hallazgos_bajos": 0})
+        daily = stats["daily"][-1]
+        daily["checks"] += row["checks"]
+        stats["total_checks"] += row["checks"]
+        stats["by_status"][row["status"]] = stats["by_status"].get(row["status"], 0) + row["checks"]
+        stats["by_typedoc"][row["typedoc"]] = stats["by_typedoc"].get(row["typedoc"], 0) + row["checks"]
+        for level in ("altos", "medios", "bajos"):
+            daily[f"hallazgos_{level}"] += row[f"hallazgos_{level}"]
+            stats["hallazgos"][level] += row[f"hallazgos_{level}"]
+    return stats
+
+def get_check_changes(user_id: int, since: str, limit: int = 500) -> tuple:
+    """
+    Return the checks of a user whose status changed after the `since` cursor, oldest change first,
+    and the cursor to pass as `since` next time.
+    """
+    changes, next_cursor, _ = _get_check_changes(user_id, "status_xid", since, limit)
+    return changes, next_cursor
+
+def get_status_cursor() -> str:
+    """
+    Return the cursor from which status changes committed from now on are returned.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            return encode_change_cursor(_change_horizon(cursor))
+    finally:
+        release_connection(conn)
+
+def get_checks_for_export(check_ids: list = None, user_id: int = None, date_from: date = None,
+                          date_to: date = None, limit: int = None) -> list:
+    """
+    Return the checks selected for a report export, by id and/or by user and date range
+    (calendar days in America/Bogota, date_to inclusive).
+    """
+    conditions = []
+    params = []
+    if check_ids is not None:
+        conditions.append("id = ANY(%s)")
+        params.append(list(check_ids))
+    if user_id:
+        conditions.append("userid = %s")
+        params.append(user_id)
+    if date_from:
+        conditions.append("timestamp >= (%s::date::timestamp AT TIME ZONE 'America/Bogota') AT TIME ZONE 'UTC'")
+        params.append(date_from)
+    if date_to:
+        conditions.append("timestamp < ((%s::date + 1)::timestamp AT TIME ZONE 'America/Bogota') AT TIME ZONE 'UTC'")
+        params.append(date_to)
+    if not conditions:
+        raise ValueError("check_ids or user_id is required")
+    params.append(limit)
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, userid, document, typedoc, status, result_id FROM backgroundcheck_requests
+                WHERE """ + " AND ".join(conditions) + """
+                ORDER BY id
+                LIMIT %s
+                """,
+                params
+            )
+            return cursor.fetchall()
+    finally:
+        release_connection(conn)
+
+def update_check_states(updates: list) -> int:
+    """
+    Apply status, status_response and result_id changes for several checks in one UPDATE.
+    Each update is a dict with id, status, status_response and result_id (None keeps the current value),
+    and optionally poll_failed and next_poll_in (seconds until the scheduler polls the check again).
+    Returns the number of updated rows.
+    """
+    if not updates:
+        return 0
+    values = [(u['id'], u['status'], u['status_response'], u.get('result_id'),
+               u.get('poll_failed', False), u.get('next_poll_in')) for u in updates]
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            execute_values(
+                cursor,
+                """
+                UPDATE backgroundcheck_requests AS r
+                SET status = v.status, status_response = v.status_response, result_id = COALESCE(v.result_id, r.result_id),
+                    poll_failures = CASE WHEN v.poll_failed THEN r.poll_failures + 1 ELSE 0 END,
+                    next_poll_at = COALESCE(NOW() + v.next_poll_in * INTERVAL '1 second', r.next_poll_at)
+                FROM (VALUES %s) AS v(id, status, status_response, result_id, poll_failed, next_poll_in)
+                WHERE r.id = v.id
+                """,
+                values,
+                template="(%s::integer, %s::varchar, %s::text, %s::varchar, %s::boolean, %s::double precision)",
+                page_size=len(values)
+            )
+            updated = cursor.rowcount
         conn.commit()
-        return True  # Successfully updated check status
+        return updated
     finally:
-        conn.close()
+        release_connection(conn)
 
 def get_processing_status(user_id: int = None) -> list:
-    conn = connect_db()
+    conn = get_connection()
     try:
         if user_id:
             query = """
@@ -187,10 +777,10 @@ def get_processing_status(user_id: int = None) -> list:
             result = cursor.fetchone()
             return result["count"] > 0
     finally:
-        conn.close()
+        release_connection(conn)
 
 def get_check(check_id: int) -> dict:
-    conn = connect_db()
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
@@ -201,10 +791,10 @@ def get_check(check_id: int) -> dict:
             )
             return cursor.fetchone()
     finally:
-        conn.close()
+        release_connection(conn)
 
 def get_check_results(check_id: int) -> dict:
-    conn = connect_db()
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
@@ -215,10 +805,130 @@ def get_check_results(check_id: int) -> dict:
             )
             return cursor.fetchone()
     finally:
-        conn.close()
+        release_connection(conn)
+
+def compress_legacy_payloads(batch_size: int = 100) -> int:
+    """
+    Move one batch of legacy TEXT result payloads to the compressed column.
+    Returns the number of converted rows, 0 once every row is converted.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, response_payload FROM backgroundcheck_results
+                WHERE response_payload_gz IS NULL AND response_payload IS NOT NULL
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (batch_size,)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return 0
+            execute_values(
+                cursor,
+                """
+                UPDATE backgroundcheck_results AS res
+                SET response_payload_gz = v.payload, response_payload = NULL
+                FROM (VALUES %s) AS v(id, payload)
+                WHERE res.id = v.id
+                """,
+                [(row["id"], psycopg2.Binary(compress_payload(row["response_payload"]))) for row in rows],
+                template="(%s::integer, %s::bytea)",
+                page_size=len(rows)
+            )
+        conn.commit()
+        return len(rows)
+    finally:
+        release_connection(conn)
+
+def extract_missing_findings(after_id: int = 0, batch_size: int = 100) -> tuple:
+    """
+    Extract the findings of one batch of results saved before findings were extracted,
+    scanning results by id after `after_id`.
+    Returns the number of scanned results and the last scanned id (0 results once done).
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT res.id, res.checkid, res.response_payload, res.response_payload_gz
+                FROM backgroundcheck_results res
+                WHERE res.id > %s
+                AND NOT EXISTS (SELECT 1 FROM backgroundcheck_findings f WHERE f.resultid = res.id)
+                ORDER BY res.id
+                LIMIT %s
+                """,
+                (after_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return 0, after_id
+            _save_findings(cursor, rows, {row["checkid"]: load_payload(row) for row in rows})
+        conn.commit()
+        return len(rows), rows[-1]["id"]
+    finally:
+        release_connection(conn)
+
+FINDING_SEVERITIES = {'alto', 'medio', 'bajo'}
+
+def search_findings(user_id: int, limit: int, source: str = None, severity: str = None,
+                    check_id: int = None, cursor: int = None) -> tuple:
+    """
+    Return one page of a user's findings, newest first, filtered by source prefix
+    (case-insensitive), severity and check, and the cursor of the next page (None on the last page).
+    """
+    if severity and severity not in FINDING_SEVERITIES:
+        raise ValueError(f"Invalid severity: {severity}. Must be one of {FINDING_SEVERITIES}.")
+
+    conditions = ["f.userid = %s"]
+    params = [user_id]
+    if source:
+        conditions.append("lower(f.source) LIKE %s")
+        params.append(source.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    if severity:
+        conditions.append("f.severity = %s")
+        params.append(severity)
+    if check_id:
+        conditions.append("f.checkid = %s")
+        params.append(check_id)
+    if cursor:
+        conditions.append("f.id < %s")
+        params.append(cursor)
+    params.append(limit + 1)
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT f.id, f.checkid, f.severity, f.source, f.description, f.detail,
+                r.document, r.typedoc,
+                to_char(r.timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'America/Bogota', 'YYYY-MM-DD HH24:MI:SS') as timestamp
+                FROM backgroundcheck_findings f
+                JOIN backgroundcheck_requests r ON r.id = f.checkid
+                WHERE """ + " AND ".join(conditions) + """
+                ORDER BY f.id DESC
+                LIMIT %s
+                """,
+                params
+            )
+            rows = cur.fetchall()
+    finally:
+        release_connection(conn)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1]["id"])
+    return [dict(row) for row in rows], next_cursor
 
 def create_user(username, password= None):
-    conn = connect_db()
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
@@ -231,12 +941,13 @@ def create_user(username, password= None):
             )
             user_id = cursor.fetchone()
         conn.commit()
+        invalidate_user(user_id['id'])
         return user_id['id']
     finally:
-        conn.close()
+        release_connection(conn)
 
 def get_user_id(username):
-    conn = connect_db()
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
@@ -251,110 +962,293 @@ def get_user_id(username):
             else:
                 return None
     finally:
-        conn.close()    
+        release_connection(conn)    
 
-def get_user_password(userid):
-    conn = connect_db()
+def get_user_login(username) -> dict:
+    """
+    Return the id and password hash of a user by username, None when it does not exist.
+    """
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
                 """
-                SELECT password FROM backgroundcheck_user WHERE id = %s
+                SELECT id, password FROM backgroundcheck_user WHERE username = %s
                 """,
-                (userid,)
+                (username,)
             )
-            result = cursor.fetchone()
-            if result:
-                return result["password"]
-            else:
-                raise ValueError("Invalid email or password")
+            return cursor.fetchone()
+    finally:
+        release_connection(conn)
+
+def get_outdated_checks(userid: int = None, limit: int = None, after_id: int = 0) -> list:
+    """
+    Return the finalized checks that have no stored results yet and whose next fetch is due, ordered by id.
+    `limit` and `after_id` allow walking them in chunks.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            user_filter = "AND r.userid = %s" if userid else ""
+            params = (after_id, userid, limit) if userid else (after_id, limit)
+            cursor.execute(
+                f"""
+                SELECT r.id, r.document, r.jobid, r.result_id, r.result_fetch_failures FROM backgroundcheck_requests r
+                WHERE r.status = 'finalizado' AND r.id > %s {user_filter}
+                AND (r.next_fetch_at IS NULL OR r.next_fetch_at <= NOW())
+                AND NOT r.results_fetched
+                ORDER BY r.id
+                LIMIT %s
+                """,
+                params
+            )
+            return cursor.fetchall()
     finally:
-        conn.close()
+        release_connection(conn)    
+
+def get_outdated_results(userid: int = None, limit: int = None) -> list:
+    """
+    Return the ids of finalized checks that have no stored results yet and are due for a fetch, oldest first.
+    """
+    return [row["id"] for row in get_outdated_checks(userid, limit)]
 
-def get_outdated_results(userid: int = None):
-    conn = connect_db()
+def record_result_fetch_failures(failures: list) -> int:
+    """
+    Push back the next result fetch of finalized checks whose results could not be fetched or stored,
+    given (check id, seconds until the next attempt) pairs.
+    Returns the number of updated rows.
+    """
+    if not failures:
+        return 0
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
-            # Get all check IDs for the user from requests table with status 'finalizado'
-            if userid:
-                query =  """
-                SELECT id FROM backgroundcheck_requests WHERE userid = %s AND status = 'finalizado'
+            execute_values(
+                cursor,
                 """
-                params = (userid,)
-            else:
-                query =  """
-                SELECT id FROM backgroundcheck_requests WHERE status = 'finalizado'
+                UPDATE backgroundcheck_requests AS r
+                SET result_fetch_failures = r.result_fetch_failures + 1,
+                    next_fetch_at = NOW() + v.next_fetch_in * INTERVAL '1 second'
+                FROM (VALUES %s) AS v(id, next_fetch_in)
+                WHERE r.id = v.id
+                """,
+                failures,
+                template="(%s::integer, %s::double precision)",
+                page_size=len(failures)
+            )
+            updated = cursor.rowcount
+        conn.commit()
+        return updated
+    finally:
+        release_connection(conn)
+
+def get_user_profile(user_id: int) -> int:
+    record = get_user_record(user_id)
+    return {"username": record["username"], "credits": record["credits"]}
+
+
+def create_batch(batch_id: str, user_id: int, country: str, legal_representative: list, checks: list):
+    """
+    Store a batch submission and its checks (as request payload dicts) in one transaction.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
                 """
-                params = ()
-            cursor.execute(query, params)
-            check_ids = [row["id"] for row in cursor.fetchall()]
-            if not check_ids:
-                return []
-            # Get all checkids that have a result
+                INSERT INTO backgroundcheck_batches (id, userid, country, legal_representative, status, total, timestamp)
+                VALUES (%s, %s, %s, %s, 'pendiente', %s, NOW())
+                """,
+                (batch_id, user_id, country, json.dumps(legal_representative), len(checks))
+            )
+            execute_values(
+                cursor,
+                """
+                INSERT INTO backgroundcheck_batch_items (batch_id, position, payload) VALUES %s
+                """,
+                [(batch_id, position, json.dumps(payload)) for position, payload in enumerate(checks)],
+                template="(%s, %s, %s::jsonb)",
+                page_size=1000
+            )
+        conn.commit()
+    finally:
+        release_connection(conn)
+
+def get_batch(batch_id: str) -> dict:
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
             cursor.execute(
                 """
-                SELECT checkid FROM backgroundcheck_results WHERE checkid = ANY(%s)
+                SELECT id, userid, country, legal_representative, status, total,
+                to_char(timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'America/Bogota', 'YYYY-MM-DD HH24:MI:SS') as timestamp
+                FROM backgroundcheck_batches WHERE id = %s
                 """,
-                (check_ids,)
+                (batch_id,)
             )
-            result_ids = {row["checkid"] for row in cursor.fetchall()}
-            # Return check_ids that are not in result_ids
-            return [cid for cid in check_ids if cid not in result_ids]
+            return cursor.fetchone()
     finally:
-        conn.close()    
+        release_connection(conn)
 
-def get_user_profile(user_id: int) -> int:
-    conn = connect_db()
+def claim_batch_items(batch_id: str, limit: int, lease_seconds: float) -> list:
+    """
+    Claim the next `limit` pending items of a batch, in submission order.
+    Items claimed by a worker that did not finish within lease_seconds are claimed again,
+    unless that worker already stored their check: those are marked with it instead of
+    being launched a second time.
+    """
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
                 """
-                SELECT username, credits FROM backgroundcheck_user WHERE id = %s
+                UPDATE backgroundcheck_batch_items AS i
+                SET status = CASE WHEN r.status = 'error' THEN 'error' ELSE 'lanzado' END, checkid = r.id
+                FROM backgroundcheck_requests r
+                WHERE i.batch_id = %s AND i.status = 'lanzando' AND i.claimed_at < NOW() - %s * INTERVAL '1 second'
+                AND r.batch_id = i.batch_id AND r.batch_position = i.position
                 """,
-                (user_id,)
+                (batch_id, lease_seconds)
             )
-            result = cursor.fetchone()
-            if result:
-                return result
-            else:
-                raise ValueError(f"No user found with id {user_id}")
+            if cursor.rowcount:
+                logging.warning(f"Batch {batch_id}: {cursor.rowcount} expired items already had a stored check, not launching them again")
+            cursor.execute(
+                """
+                UPDATE backgroundcheck_batch_items
+                SET status = 'lanzando', claimed_at = NOW()
+                WHERE batch_id = %s AND position IN (
+                    SELECT position FROM backgroundcheck_batch_items
+                    WHERE batch_id = %s
+                    AND (status = 'pendiente' OR (status = 'lanzando' AND claimed_at < NOW() - %s * INTERVAL '1 second'))
+                    ORDER BY position
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING position, payload
+                """,
+                (batch_id, batch_id, lease_seconds, limit)
+            )
+            items = sorted(cursor.fetchall(), key=lambda item: item["position"])
+            cursor.execute(
+                """
+                UPDATE backgroundcheck_batches
+                SET status = CASE WHEN status = 'pendiente' THEN 'procesando' ELSE status END, heartbeat_at = NOW()
+                WHERE id = %s
+                """,
+                (batch_id,)
+            )
+        conn.commit()
+        return items
     finally:
-        conn.close()    
+        release_connection(conn)
 
-def update_status_response(check_id: int, status_response: str) -> bool:
-    conn = connect_db()
+def complete_batch_items(batch_id: str, updates: list) -> bool:
+    """
+    Record the outcome of claimed batch items, given dicts with position, status and checkid.
+    Marks the batch as launched once no item is left to launch.
+    Returns True if the batch still has items to launch.
+    """
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
+            if updates:
+                execute_values(
+                    cursor,
+                    """
+                    UPDATE backgroundcheck_batch_items AS i
+                    SET status = v.status, checkid = v.checkid
+                    FROM (VALUES %s) AS v(batch_id, position, status, checkid)
+                    WHERE i.batch_id = v.batch_id AND i.position = v.position
+                    """,
+                    [(batch_id, u['position'], u['status'], u['checkid']) for u in updates],
+                    template="(%s::varchar, %s::integer, %s::varchar, %s::integer)",
+                    page_size=len(updates)
+                )
             cursor.execute(
                 """
-                UPDATE backgroundcheck_requests SET status_response = %s WHERE id = %s
+                SELECT EXISTS (
+                    SELECT 1 FROM backgroundcheck_batch_items WHERE batch_id = %s AND status IN ('pendiente', 'lanzando')
+                ) AS remaining
                 """,
-                (status_response, check_id)
+                (batch_id,)
             )
-            if cursor.rowcount == 0:
-                return False  # No rows were updated, check might not exist
+            remaining = cursor.fetchone()["remaining"]
+            if not remaining:
+                cursor.execute(
+                    """
+                    UPDATE backgroundcheck_batches SET status = 'lanzado', launched_at = NOW() WHERE id = %s
+                    """,
+                    (batch_id,)
+                )
         conn.commit()
-        return True  # Successfully updated check status
+        return remaining
     finally:
-        conn.close()
+        release_connection(conn)
 
-def update_check_result_id(check_id: int, result_id: int) -> bool:
-    conn = connect_db()
+def touch_batch(batch_id: str):
+    """
+    Record that a worker is still handling a batch, so batchSweepTimer does not re-queue it.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("UPDATE backgroundcheck_batches SET heartbeat_at = NOW() WHERE id = %s", (batch_id,))
+        conn.commit()
+    finally:
+        release_connection(conn)
+
+def claim_stalled_batches(stale_seconds: float, limit: int = 100) -> list:
+    """
+    Return the ids of unfinished batches with items left to launch that no worker has touched
+    for stale_seconds (e.g. because their queue message was moved to the poison queue).
+    Their heartbeat is renewed so they are not returned again before stale_seconds.
+    """
+    conn = get_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
                 """
-                UPDATE backgroundcheck_requests SET result_id = %s WHERE id = %s
+                UPDATE backgroundcheck_batches
+                SET heartbeat_at = NOW()
+                WHERE id IN (
+                    SELECT b.id FROM backgroundcheck_batches b
+                    WHERE b.status IN ('pendiente', 'procesando')
+                    AND COALESCE(b.heartbeat_at, b.timestamp) < NOW() - %s * INTERVAL '1 second'
+                    AND EXISTS (
+                        SELECT 1 FROM backgroundcheck_batch_items i
+                        WHERE i.batch_id = b.id AND i.status IN ('pendiente', 'lanzando')
+                    )
+                    ORDER BY COALESCE(b.heartbeat_at, b.timestamp)
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id
                 """,
-                (result_id, check_id)
+                (stale_seconds, limit)
             )
-            if cursor.rowcount == 0:
-                return False  # No rows were updated, check might not exist
+            batch_ids = [row["id"] for row in cursor.fetchall()]
         conn.commit()
-        return True  # Successfully updated check status
+        return batch_ids
+    finally:
+        release_connection(conn)
+
+def get_batch_progress(batch_id: str) -> dict:
+    """
+    Aggregate counts of a batch's items: launch outcome and status of the launched checks.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT COALESCE(r.status, i.status) AS status, COUNT(*) AS count
+                FROM backgroundcheck_batch_items i
+                LEFT JOIN backgroundcheck_requests r ON r.id = i.checkid
+                WHERE i.batch_id = %s
+                GROUP BY 1
+                """,
+                (batch_id,)
+            )
+            return {row["status"]: row["count"] for row in cursor.fetchall()}
     finally:
-        conn.close()
-        
-if __name__ == '__main__': 
-    r = get_outdated_results()
-    print(r)
+        release_connection(conn)
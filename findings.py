@@ -0,0 +1,47 @@
+import os
+import json
+
+# Keys of the hallazgo lists in a report_json payload and the severity stored for them
+SEVERITY_LEVELS = {"altos": "alto", "medios": "medio", "bajos": "bajo"}
+# Item fields holding the source and the description, in order of preference
+FINDING_SOURCE_KEYS = ("fuente", "source", "nombre_fuente", "entidad", "lista")
+FINDING_DESCRIPTION_KEYS = ("descripcion", "hallazgo", "description", "detalle", "resultado")
+FINDING_DESCRIPTION_MAX_LENGTH = int(os.environ.get("FINDING_DESCRIPTION_MAX_LENGTH", 2000))
+
+def _first_text(item: dict, keys: tuple) -> str:
+    for key in keys:
+        value = item.get(key)
+        if value not in (None, "", [], {}):
+            return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return None
+
+def extract_findings(payload) -> list:
+    """
+    Normalize the hallazgos of a report_json payload (dict_hallazgos) into a list of
+    dicts with severity, source, description and the original item as detail.
+    Strings are assumed to hold JSON.
+    """
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+    if not isinstance(payload, dict):
+        return []
+    dict_hallazgos = payload.get('dict_hallazgos') or {}
+    if not isinstance(dict_hallazgos, dict):
+        return []
+
+    findings = []
+    for key, severity in SEVERITY_LEVELS.items():
+        for item in dict_hallazgos.get(key) or []:
+            if isinstance(item, dict):
+                source = _first_text(item, FINDING_SOURCE_KEYS)
+                description = _first_text(item, FINDING_DESCRIPTION_KEYS)
+                detail = item
+            else:
+                source, description, detail = None, str(item), None
+            findings.append({
+                "severity": severity,
+                "source": source.strip()[:255] if source else None,
+                "description": description[:FINDING_DESCRIPTION_MAX_LENGTH] if description else None,
+                "detail": detail,
+            })
+    return findings
@@ -1,26 +1,51 @@
 import azure.functions as func
 import logging
 import json
-from models import BackgroundCheckRequest
+import asyncio
+from models import BackgroundCheckRequest, BatchCheckRequest, BatchCheckResponse
 import traceback
-from db_operations import (save_backgroundCheck_request, 
-                        get_user_credits_counter, 
-                        update_user_credits_counter, 
-                        get_user_checks, 
-                        get_processing_status, 
+from datetime import date, datetime
+import io
+from db_operations import (reserve_user_credits, 
+                        settle_user_credits, 
+                        get_user_checks_page, get_user_checks_since, get_user_checks_version,
+                        get_processing_status, get_status_cursor, decode_change_cursor, get_user_stats,
+                        search_findings,
                         get_check, get_check_results,
-                        save_backgroundCheck_result, 
-                        get_user_profile, 
-                        update_check_result_id, 
-                        get_outdated_results)
-from db_operations import create_user, get_user_id, get_user_password
+                        get_checks_for_export,
+                        get_batch, get_batch_progress,
+                        get_user_profile)
+from db_operations import create_user, get_user_id, get_user_login
 import os
-from tusdatos_client import launch_verify, sync_pending_checks, update_pending_results, launch_report_html, launch_report_pdf
+from tusdatos_client import (launch_checks, charged_checks, launch_report_html, launch_report_pdf, iter_report_chunks,
+                             upstream_available, circuit_state)
+from sync_worker import run_sync_cycle
+from migrate import apply_migrations
+from payload_store import accepts_gzip, load_payload
+from report_cache import get_report_cache, report_key
+from report_export import export_reports_zip, EXPORT_MAX_CHECKS
+from batch_worker import (validate_batch, submit_batch, process_batch_chunk, enqueue_batch, batch_message,
+                          sweep_stalled_batches, BATCH_QUEUE_NAME, BATCH_SWEEP_SCHEDULE)
+from status_notifier import wait_for_check_changes, LONGPOLL_MAX_SECONDS
 
 logging.basicConfig(level=logging.INFO)
 
 app = func.FunctionApp(http_auth_level=func.AuthLevel.FUNCTION)
 
+if os.environ.get("APPLY_MIGRATIONS_ON_STARTUP", "false").lower() == "true":
+    try:
+        apply_migrations()
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        logging.error(f"Error applying database migrations: {str(e)}")
+
+# Page size of getUserChecks
+CHECKS_PAGE_SIZE = int(os.environ.get("CHECKS_PAGE_SIZE", 100))
+CHECKS_MAX_PAGE_SIZE = int(os.environ.get("CHECKS_MAX_PAGE_SIZE", 500))
+
+# NCRONTAB schedule of the background sync worker (every 15 seconds by default)
+SYNC_TIMER_SCHEDULE = os.environ.get("SYNC_TIMER_SCHEDULE", "*/15 * * * * *")
+
 @app.function_name(name="swagger_json")
 @app.route(route="swagger.json", auth_level=func.AuthLevel.ANONYMOUS)
 def swagger_json(req: func.HttpRequest) -> func.HttpResponse:
@@ -44,37 +69,25 @@ def backgroundCheck(req: func.HttpRequest) -> func.HttpResponse:
         if not req_body or not user_id:
             return func.HttpResponse("User ID and checks are required", status_code=400)
         
+        checks = [BackgroundCheckRequest(**item) for item in req_body]
+        if not upstream_available():
+            # Fail fast without reserving credits while tusdatos is unavailable
+            return func.HttpResponse(
+                json.dumps({'status': 'failed', 'message': 'Background check provider is temporarily unavailable'}),
+                status_code=503, mimetype="application/json", headers={"Retry-After": str(int(circuit_state()['retry_in'] or 1))}
+            )
+        reserved = reserve_user_credits(user_id, len(checks))
+        logging.info(f"Reserved {reserved} credits for user {user_id}.")
+
+        if reserved < len(checks):
+            logging.warning(f"User {user_id} has insufficient credits to process further requests.")
+
         request_ids = []
-        current_user_credits, current_user_counter = get_user_credits_counter(user_id)
-        logging.info(f"User {user_id} has {current_user_credits} credits.")
-
-        for item in req_body:
-            if current_user_credits <= 0:
-                logging.warning(f"User {user_id} has insufficient credits to process further requests.")
-                break
-            current_user_credits = current_user_credits -1
-            current_user_counter = current_user_counter + 1
-
-            request_data = BackgroundCheckRequest(**item)
-            status_code, response_dict = launch_verify(request_data)
-            logging.info(f"Background check launched for document {request_data.doc} with status code {status_code}. Respose dict {response_dict}")
-
-            # Save the request to the database
-            request_id = save_backgroundCheck_request(userid=user_id,
-                                                        document=request_data.doc,
-                                                        typedoc=request_data.typedoc,
-                                                        payload=request_data.model_dump(),
-                                                        jobid=response_dict['jobid'],
-                                                        status=response_dict['status'],
-                                                        response_code=status_code,
-                                                        response_content=response_dict['response_data'])
-            if status_code == 200 and response_dict['id']:
-                update_check_result_id(request_id, response_dict['id'])
-                
-            request_ids.append({'id': request_id,'doc': request_data.doc,  'status': response_dict['status'], 'response': response_dict['response_data']})
-
-            # Update user credits in the database
-            update_user_credits_counter(user_id, current_user_credits, current_user_counter)
+        try:
+            request_ids = launch_checks(user_id, checks[:reserved])
+        finally:
+            # Refund the credits of checks that could not be launched or reused an earlier check
+            settle_user_credits(user_id, reserved, charged_checks(request_ids))
 
         if not request_ids:
             return func.HttpResponse(
@@ -95,6 +108,99 @@ def backgroundCheck(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500, mimetype="application/json"
         )
 
+@app.route(route="batchCheck", methods=["POST"])
+@app.queue_output(arg_name="msg", queue_name=BATCH_QUEUE_NAME, connection="AzureWebJobsStorage")
+def batchCheck(req: func.HttpRequest, msg: func.Out[str]) -> func.HttpResponse:
+    logging.info('Processing batchCheck request')
+    try:
+        req_body = req.get_json()
+        user_id = req_body.pop('user_id', None)
+        if not user_id:
+            return func.HttpResponse("User ID is required", status_code=400)
+
+        try:
+            batch = BatchCheckRequest(**req_body)
+            get_user_profile(user_id)
+        except ValueError as e:
+            return func.HttpResponse(
+                json.dumps({'status': 'failed', 'message': str(e)}),
+                status_code=400, mimetype="application/json"
+            )
+        errors = validate_batch(batch)
+        if errors:
+            return func.HttpResponse(
+                json.dumps({'status': 'failed', 'message': 'Invalid batch', 'errors': errors}),
+                status_code=400, mimetype="application/json"
+            )
+
+        batch_id = submit_batch(user_id, batch)
+        msg.set(batch_message(batch_id))
+
+        return func.HttpResponse(
+            BatchCheckResponse(batch_id=batch_id, status='pendiente').model_dump_json(),
+            status_code=202, mimetype="application/json"
+        )
+
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        logging.error(f"Error in batchCheck endpoint: {str(e)}")
+        return func.HttpResponse(
+            json.dumps({"error": f"Internal server error {str(e)}"}), 
+            status_code=500, mimetype="application/json"
+        )
+
+@app.function_name(name="batchCheckWorker")
+@app.queue_trigger(arg_name="msg", queue_name=BATCH_QUEUE_NAME, connection="AzureWebJobsStorage")
+@app.queue_output(arg_name="next_msg", queue_name=BATCH_QUEUE_NAME, connection="AzureWebJobsStorage")
+def batchCheckWorker(msg: func.QueueMessage, next_msg: func.Out[str]) -> None:
+    batch_id = json.loads(msg.get_body().decode('utf-8'))['batch_id']
+    logging.info(f"Processing batch {batch_id}")
+    # Each message launches one chunk, the next chunk is queued as a new message,
+    # delayed instead of holding the worker when it has to wait
+    delay = process_batch_chunk(batch_id)
+    if delay is None:
+        return
+    if delay > 0:
+        enqueue_batch(batch_id, delay)
+    else:
+        next_msg.set(batch_message(batch_id))
+
+@app.function_name(name="batchSweepTimer")
+@app.timer_trigger(schedule=BATCH_SWEEP_SCHEDULE, arg_name="timer", run_on_startup=False, use_monitor=False)
+def batchSweepTimer(timer: func.TimerRequest) -> None:
+    try:
+        sweep_stalled_batches()
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        logging.error(f"Error in batchSweepTimer: {str(e)}")
+
+@app.route(route="batchStatus/{batch_id}", methods=["GET"])
+def batchStatus(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Processing batchStatus request')
+
+    try:
+        batch_id = req.route_params.get('batch_id')
+        if not batch_id:
+            return func.HttpResponse("Batch ID is required", status_code=400)
+
+        batch = get_batch(batch_id)
+        if not batch:
+            return func.HttpResponse(
+                json.dumps({'status': 'failed', 'message': 'No batch found for the given batch_id'}),
+                status_code=404, mimetype="application/json"
+            )
+
+        progress = get_batch_progress(batch_id)
+        return func.HttpResponse(
+            json.dumps({'status': 'success', 'batch': batch, 'progress': progress}),
+            status_code=200, mimetype="application/json"
+        )
+
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        logging.error(f"Error in batchStatus endpoint: {str(e)}")
+        return func.HttpResponse(f"Internal server error : {str(e)}", status_code=500)
+
 @app.route(route="getUserChecks/{user_id}", methods=["GET"])
 def getUserChecks(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Processing getUserChecks request')
@@ -103,20 +209,53 @@ def getUserChecks(req: func.HttpRequest) -> func.HttpResponse:
         user_id = req.route_params.get('user_id')
         if not user_id:
             return func.HttpResponse("User ID is required", status_code=400)
-        
-        # Step 1: Check the status of the background check
-        checks_list = get_user_checks(user_id)
-        logging.info(f"User {user_id} has {len(checks_list)} checks.")
+
+        # Changes whenever a check of the user or its result is inserted or changed
+        version, since_cursor = get_user_checks_version(user_id)
+        etag = checks_etag(user_id, version, req.params)
+        if etag_matches(req.headers.get('If-None-Match'), etag):
+            return func.HttpResponse(status_code=304, headers={"ETag": etag})
+
+        try:
+            limit = min(max(int(req.params.get('limit', CHECKS_PAGE_SIZE)), 1), CHECKS_MAX_PAGE_SIZE)
+            since = req.params.get('since')
+            if since is not None:
+                # Delta mode: only the checks inserted or changed after the `since` cursor
+                checks_list, next_since, has_more = get_user_checks_since(user_id, since, limit)
+                return func.HttpResponse(
+                    json.dumps({'status': 'success', 'checks': checks_list, 'since': next_since, 'has_more': has_more}),
+                    status_code=200, mimetype="application/json", headers={"ETag": etag}
+                )
+
+            date_from = req.params.get('date_from')
+            date_to = req.params.get('date_to')
+            has_high_findings = req.params.get('has_high_findings')
+            checks_list, next_cursor = get_user_checks_page(
+                user_id, limit,
+                cursor=req.params.get('cursor'),
+                sort=req.params.get('sort', 'timestamp_desc'),
+                status=req.params.get('status'),
+                typedoc=req.params.get('typedoc'),
+                date_from=date.fromisoformat(date_from) if date_from else None,
+                date_to=date.fromisoformat(date_to) if date_to else None,
+                doc_prefix=req.params.get('doc_prefix'),
+                has_high_findings=parse_bool(has_high_findings) if has_high_findings else None)
+        except ValueError as e:
+            return func.HttpResponse(
+                json.dumps({'status': 'failed', 'message': str(e)}),
+                status_code=400, mimetype="application/json"
+            )
+        logging.info(f"User {user_id} page has {len(checks_list)} checks.")
 
         if not checks_list:
             return func.HttpResponse(
-                json.dumps({'status': 'success', 'message': 'No checks found'}),
-                status_code=200, mimetype="application/json"
+                json.dumps({'status': 'success', 'message': 'No checks found', 'next_cursor': None, 'since': since_cursor}),
+                status_code=200, mimetype="application/json", headers={"ETag": etag}
             )
 
         return func.HttpResponse(
-                json.dumps({'status': 'success', 'checks': checks_list}),
-                status_code=200, mimetype="application/json"
+                json.dumps({'status': 'success', 'checks': checks_list, 'next_cursor': next_cursor, 'since': since_cursor}),
+                status_code=200, mimetype="application/json", headers={"ETag": etag}
             )
 
     except Exception as e:
@@ -124,6 +263,74 @@ def getUserChecks(req: func.HttpRequest) -> func.HttpResponse:
         logging.error(f"Error in getUserChecks endpoint: {str(e)}")
         return func.HttpResponse(f"Internal server error : {str(e)}", status_code=500)
 
+@app.route(route="getUserStats/{user_id}", methods=["GET"])
+def getUserStats(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Processing getUserStats request')
+
+    try:
+        user_id = req.route_params.get('user_id')
+        if not user_id:
+            return func.HttpResponse("User ID is required", status_code=400)
+
+        try:
+            date_from = req.params.get('date_from')
+            date_to = req.params.get('date_to')
+            daily = req.params.get('daily')
+            stats = get_user_stats(
+                user_id,
+                date_from=date.fromisoformat(date_from) if date_from else None,
+                date_to=date.fromisoformat(date_to) if date_to else None)
+            if not (parse_bool(daily) if daily else False):
+                del stats['daily']
+        except ValueError as e:
+            return func.HttpResponse(
+                json.dumps({'status': 'failed', 'message': str(e)}),
+                status_code=400, mimetype="application/json"
+            )
+
+        return func.HttpResponse(
+            json.dumps({'status': 'success', 'stats': stats}),
+            status_code=200, mimetype="application/json"
+        )
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        logging.error(f"Error in getUserStats endpoint: {str(e)}")
+        return func.HttpResponse(f"Internal server error : {str(e)}", status_code=500)
+
+@app.route(route="searchFindings/{user_id}", methods=["GET"])
+def searchFindings(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Processing searchFindings request')
+
+    try:
+        user_id = req.route_params.get('user_id')
+        if not user_id:
+            return func.HttpResponse("User ID is required", status_code=400)
+
+        try:
+            limit = min(max(int(req.params.get('limit', CHECKS_PAGE_SIZE)), 1), CHECKS_MAX_PAGE_SIZE)
+            check_id = req.params.get('check_id')
+            cursor = req.params.get('cursor')
+            findings, next_cursor = search_findings(
+                user_id, limit,
+                source=req.params.get('source'),
+                severity=req.params.get('severity'),
+                check_id=int(check_id) if check_id else None,
+                cursor=int(cursor) if cursor else None)
+        except ValueError as e:
+            return func.HttpResponse(
+                json.dumps({'status': 'failed', 'message': str(e)}),
+                status_code=400, mimetype="application/json"
+            )
+
+        return func.HttpResponse(
+            json.dumps({'status': 'success', 'findings': findings, 'next_cursor': next_cursor}),
+            status_code=200, mimetype="application/json"
+        )
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        logging.error(f"Error in searchFindings endpoint: {str(e)}")
+        return func.HttpResponse(f"Internal server error : {str(e)}", status_code=500)
+
 @app.route(route="backgroundCheckSyncStatus/{user_id}", methods=["GET"])
 def backgroundCheckSyncStatus(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Processing userIsProcessing request')
@@ -136,17 +343,12 @@ def backgroundCheckSyncStatus(req: func.HttpRequest) -> func.HttpResponse:
         # if not user_id:
         #     # return func.HttpResponse("User ID is required", status_code=400)
         
-        # Step 1: Check the status of the background check
+        # Pending checks are synced by the backgroundCheckSyncTimer function, this is a status read only
         needs_sync = get_processing_status(user_id)
-        _state_changed = False
         logging.info(f"User {user_id} is processing: {needs_sync}")    
-        if needs_sync:
-            _state_changed = sync_pending_checks(user_id)
-        if _state_changed or any(get_outdated_results(user_id)):
-            update_pending_results(user_id)
 
         return func.HttpResponse(
-                json.dumps({'status': 'success', 'processing': needs_sync}),
+                json.dumps({'status': 'success', 'processing': needs_sync, 'upstream': circuit_state()['state']}),
                 status_code=200, mimetype="application/json"
             )
     except Exception as e:
@@ -154,6 +356,55 @@ def backgroundCheckSyncStatus(req: func.HttpRequest) -> func.HttpResponse:
         logging.error(f"Error in userIsProcessing endpoint: {str(e)}")
         return func.HttpResponse(f"Internal server error : {str(e)}", status_code=500)
 
+# Async so that waiting long polls do not hold the worker threads (PYTHON_THREADPOOL_THREAD_COUNT)
+# that the synchronous functions run on
+@app.route(route="checkUpdates/{user_id}", methods=["GET"])
+async def checkUpdates(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Processing checkUpdates request')
+
+    try:
+        user_id = req.route_params.get('user_id')
+        if not user_id:
+            return func.HttpResponse("User ID is required", status_code=400)
+
+        try:
+            cursor = req.params.get('cursor')
+            timeout = min(max(float(req.params.get('timeout', LONGPOLL_MAX_SECONDS)), 0), LONGPOLL_MAX_SECONDS)
+            if cursor:
+                decode_change_cursor(cursor)
+        except ValueError as e:
+            return func.HttpResponse(
+                json.dumps({'status': 'failed', 'message': str(e)}),
+                status_code=400, mimetype="application/json"
+            )
+
+        if not cursor:
+            # First call: hand out the current cursor, changes are reported from there on
+            changes, next_cursor = [], await asyncio.to_thread(get_status_cursor)
+        else:
+            # Long poll: returns as soon as a check of the user changes status, or empty after the timeout
+            changes, next_cursor = await wait_for_check_changes(user_id, cursor, timeout)
+
+        return func.HttpResponse(
+            json.dumps({'status': 'success', 'checks': changes, 'cursor': next_cursor}),
+            status_code=200, mimetype="application/json"
+        )
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        logging.error(f"Error in checkUpdates endpoint: {str(e)}")
+        return func.HttpResponse(f"Internal server error : {str(e)}", status_code=500)
+
+@app.function_name(name="backgroundCheckSyncTimer")
+@app.timer_trigger(schedule=SYNC_TIMER_SCHEDULE, arg_name="timer", run_on_startup=False, use_monitor=False)
+def backgroundCheckSyncTimer(timer: func.TimerRequest) -> None:
+    if timer.past_due:
+        logging.warning('backgroundCheckSyncTimer is running late')
+    try:
+        run_sync_cycle()
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        logging.error(f"Error in backgroundCheckSyncTimer: {str(e)}")
+
 @app.route(route="backgroundCheckResults/{check_id}", methods=["GET"])
 def backgroundCheckResults(req: func.HttpRequest) -> func.HttpResponse:
         
@@ -170,11 +421,21 @@ def backgroundCheckResults(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=404, mimetype="application/json"
             )
 
-        results_data = check_results['response_payload']
+        # Compressed payloads are sent as stored when the client accepts gzip
+        payload_gz = check_results.get('response_payload_gz')
+        if payload_gz is not None and accepts_gzip(req.headers.get('Accept-Encoding')):
+            return func.HttpResponse(
+                bytes(payload_gz),
+                status_code=200, mimetype="application/json",
+                headers={'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'}
+            )
+
+        results_data = load_payload(check_results)
 
         return func.HttpResponse(
             results_data,
-            status_code=200, mimetype="application/json"
+            status_code=200, mimetype="application/json",
+            headers={'Vary': 'Accept-Encoding'}
         )
         
     except Exception as e:
@@ -182,6 +443,12 @@ def backgroundCheckResults(req: func.HttpRequest) -> func.HttpResponse:
         logging.error(f"Error in backgroundCheckResults endpoint: {str(e)}")
         return func.HttpResponse(f"Internal server error : {str(e)}", status_code=500)
 
+def report_unavailable() -> func.HttpResponse:
+    return func.HttpResponse(
+        json.dumps({'status': 'failed', 'message': 'Could not fetch the report from the provider'}),
+        status_code=502, mimetype="application/json"
+    )
+
 @app.route(route="getCheckReport_pdf/{check_id}", methods=["GET"])
 def getCheckReport_pdf(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Processing getCheckReport request')
@@ -211,11 +478,41 @@ def getCheckReport_pdf(req: func.HttpRequest) -> func.HttpResponse:
             )
         type_doc = check.get('typedoc')
         logging.info(f"Launching PDF report for check_id {check_id} with result_id {result_id} and type_doc {type_doc}")
-        pdf_report_response = launch_report_pdf(result_id, type_doc)
-        
+        # The report is streamed from the provider into the cache, then served from it
+        cache = get_report_cache()
+        key = report_key(result_id, 'pdf', type_doc)
+        fetch_chunks = lambda: iter_report_chunks(launch_report_pdf(result_id, type_doc, stream=True))
+        size = cache.ensure(key, fetch_chunks)
+
+        if size is None:
+            return report_unavailable()
+
+        try:
+            byte_range = parse_byte_range(req.headers.get('Range'), size)
+        except ValueError:
+            return func.HttpResponse(
+                status_code=416, headers={'Content-Range': f'bytes */{size}', 'Accept-Ranges': 'bytes'}
+            )
+
+        # The report may have been evicted since it was ensured, in which case it is fetched again
+        if byte_range:
+            start, end = byte_range
+            data = cache.read_or_fetch(key, fetch_chunks, start, end - start + 1)
+            if data is None:
+                return report_unavailable()
+            return func.HttpResponse(
+                        data,
+                        status_code=206, mimetype="application/pdf",
+                        headers={'Content-Range': f'bytes {start}-{end}/{size}', 'Accept-Ranges': 'bytes'}
+            )
+
+        data = cache.read_or_fetch(key, fetch_chunks)
+        if data is None:
+            return report_unavailable()
         return func.HttpResponse(
-                        pdf_report_response.content,
-                        status_code=200, mimetype="application/pdf"
+                        data,
+                        status_code=200, mimetype="application/pdf",
+                        headers={'Accept-Ranges': 'bytes'}
             )
 
     except Exception as e:
@@ -251,10 +548,16 @@ def getCheckReport_html(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=400, mimetype="application/json"
             )
         
-        html_report_response = launch_report_html(result_id)
-        
+        type_doc = check.get('typedoc')
+        cache = get_report_cache()
+        key = report_key(result_id, 'html', type_doc)
+        data = cache.read_or_fetch(key, lambda: iter_report_chunks(launch_report_html(result_id, stream=True)))
+
+        if data is None:
+            return report_unavailable()
+
         return func.HttpResponse(
-                        html_report_response.content,
+                        data,
                         status_code=200, mimetype="text/html"
             )
 
@@ -263,6 +566,59 @@ def getCheckReport_html(req: func.HttpRequest) -> func.HttpResponse:
         logging.error(f"Error in getCheckReport endpoint: {str(e)}")
         return func.HttpResponse(f"Internal server error : {str(e)}", status_code=500)
     
+@app.route(route="exportReports", methods=["POST"])
+def exportReports(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Processing exportReports request')
+
+    try:
+        req_body = req.get_json()
+        check_ids = req_body.get('check_ids')
+        user_id = req_body.get('user_id')
+        if not check_ids and not user_id:
+            return func.HttpResponse("check_ids or user_id is required", status_code=400)
+
+        try:
+            date_from = req_body.get('date_from')
+            date_to = req_body.get('date_to')
+            if check_ids is not None:
+                if not isinstance(check_ids, list) or not all(
+                        isinstance(check_id, int) and not isinstance(check_id, bool) for check_id in check_ids):
+                    raise ValueError("check_ids must be a list of integers")
+                if len(check_ids) > EXPORT_MAX_CHECKS:
+                    raise ValueError(f"At most {EXPORT_MAX_CHECKS} checks can be exported at once")
+            checks = get_checks_for_export(check_ids=check_ids, user_id=user_id,
+                                           date_from=date.fromisoformat(date_from) if date_from else None,
+                                           date_to=date.fromisoformat(date_to) if date_to else None,
+                                           limit=EXPORT_MAX_CHECKS + 1)
+            if len(checks) > EXPORT_MAX_CHECKS:
+                raise ValueError(f"At most {EXPORT_MAX_CHECKS} checks can be exported at once, narrow the date range")
+        except (ValueError, TypeError) as e:
+            return func.HttpResponse(
+                json.dumps({'status': 'failed', 'message': str(e)}),
+                status_code=400, mimetype="application/json"
+            )
+
+        if not checks:
+            return func.HttpResponse(
+                json.dumps({'status': 'failed', 'message': 'No checks found for the given filter'}),
+                status_code=404, mimetype="application/json"
+            )
+
+        # The response body is a single bytes object, export_reports_zip keeps it under EXPORT_MAX_BYTES
+        archive = io.BytesIO()
+        manifest = export_reports_zip(checks, archive, requested_ids=check_ids)
+        logging.info(f"Exported {len(manifest['exported'])} reports, {len(manifest['failed'])} failed")
+        return func.HttpResponse(
+            archive.getvalue(),
+            status_code=200, mimetype="application/zip",
+            headers={'Content-Disposition': f'attachment; filename="reports_{datetime.now():%Y%m%d_%H%M%S}.zip"'}
+        )
+
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        logging.error(f"Error in exportReports endpoint: {str(e)}")
+        return func.HttpResponse(f"Internal server error : {str(e)}", status_code=500)
+
 @app.route(route="registerUser", methods=["POST"])
 def registerUser(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Processing registerUser request')
@@ -312,19 +668,18 @@ def login(req: func.HttpRequest) -> func.HttpResponse:
 
         username = req_body['username']
         password = req_body['password']
-        user_id = get_user_id(username)
+        # Id and stored hashed password in a single lookup
+        user = get_user_login(username)
 
-        if not user_id:
+        if not user:
             return func.HttpResponse(
                 json.dumps({'status': 'failed', 'message': 'Invalid username or password'}),
                 status_code=401, mimetype="application/json"
             )
-
-        # Retrieve the stored hashed password for the user
-        stored_hashed_password = get_user_password(user_id)  # Implement this function to fetch the hashed password
+        user_id = user['id']
 
         # Validate the provided password against the stored hash
-        if not check_password_hash(password, stored_hashed_password):
+        if not check_password_hash(password, user['password']):
             return func.HttpResponse(
                 json.dumps({'status': 'failed', 'message': 'Invalid username or password'}),
                 status_code=401, mimetype="application/json"
@@ -379,4 +734,50 @@ def check_password_hash(password, hashed_password):
 
 def generate_password_hash(password):
     # Hash the password using SHA-256
-    return hashlib.sha256(password .encode()).hexdigest()   
\ No newline at end of file
+    return hashlib.sha256(password .encode()).hexdigest()
+
+def parse_bool(value: str) -> bool:
+    if value.lower() in ('true', '1', 'yes'):
+        return True
+    if value.lower() in ('false', '0', 'no'):
+        return False
+    raise ValueError(f"Invalid boolean value: {value}")
+
+def checks_etag(user_id, version: int, params) -> str:
+    """
+    ETag of a getUserChecks response: the user's checks version and the query parameters.
+    """
+    query = "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+    digest = hashlib.sha256(f"{user_id}?{query}".encode("utf-8")).hexdigest()[:16]
+    return f'"{version}-{digest}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+def parse_byte_range(range_header: str, size: int) -> tuple:
+    """
+    Parse a single-range `Range: bytes=...` header into an inclusive (start, end) pair.
+    Returns None when the header is absent or not a single byte range (the full body is
+    sent), raises ValueError when the range cannot be satisfied.
+    """
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    first, _, last = range_header[len('bytes='):].strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        elif last:
+            start = max(size - int(last), 0)
+            end = size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError(f"Unsatisfiable range {range_header} for {size} bytes")
+    return start, end
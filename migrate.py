@@ -0,0 +1,212 @@
+import os
+import re
+import sys
+import logging
+import psycopg2
+from db_operations import get_connection, release_connection, compress_legacy_payloads, extract_missing_findings
+
+logging.basicConfig(level=logging.INFO)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+# Serializes concurrent migration runs (e.g. several workers starting at once)
+MIGRATIONS_LOCK_KEY = 7400315
+
+# Hot queries whose plans must use an index, with sample parameters for EXPLAIN
+HOT_QUERIES = {
+    "get_processing_status": (
+        "SELECT COUNT(*) FROM backgroundcheck_requests WHERE userid = %s AND status = 'procesando'", (1,)),
+    "claim_due_checks": (
+        "SELECT id FROM backgroundcheck_requests WHERE status = 'procesando' AND (next_poll_at IS NULL OR next_poll_at <= NOW()) "
+        "ORDER BY next_poll_at NULLS FIRST, id LIMIT 200", ()),
+    "get_outdated_results": (
+        "SELECT r.id FROM backgroundcheck_requests r WHERE r.status = 'finalizado' AND r.userid = %s "
+        "AND NOT r.results_fetched ORDER BY r.id LIMIT 100", (1,)),
+    "get_outdated_results_all_users": (
+        "SELECT r.id FROM backgroundcheck_requests r WHERE r.status = 'finalizado' AND r.id > %s "
+        "AND (r.next_fetch_at IS NULL OR r.next_fetch_at <= NOW()) AND NOT r.results_fetched ORDER BY r.id LIMIT 20", (0,)),
+    "get_check_results": (
+        "SELECT * FROM backgroundcheck_results WHERE checkid = %s", (1,)),
+    "search_findings": (
+        "SELECT id FROM backgroundcheck_findings WHERE userid = %s AND lower(source) LIKE %s ORDER BY id DESC LIMIT 100",
+        (1, "ofac%")),
+}
+
+INDEX_NODE_TYPES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+# Index creations of the migration scripts, all written as CREATE [UNIQUE] INDEX IF NOT EXISTS
+INDEX_STATEMENT = re.compile(r"CREATE\s+(UNIQUE\s+)?INDEX\s+IF\s+NOT\s+EXISTS\s+(\w+)\s+ON\s+(\w+)(.*?);", re.S)
+
+def list_migrations() -> list:
+    """
+    Return the (version, name, path) of every migration file, in order.
+    """
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = re.match(r"^(\d+)_(\w+)\.sql$", filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+def get_applied_versions(cursor) -> set:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT NOW()
+        )
+        """
+    )
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row["version"] for row in cursor.fetchall()}
+
+def apply_migrations() -> list:
+    """
+    Apply every pending migration, each one in its own transaction.
+    Returns the names of the applied migrations.
+    """
+    applied = []
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_KEY,))
+            try:
+                done = get_applied_versions(cursor)
+                conn.commit()
+                for version, name, path in list_migrations():
+                    if version in done:
+                        continue
+                    logging.info(f"Applying migration {version:04d}_{name}")
+                    with open(path, "r") as f:
+                        cursor.execute(f.read())
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (version, name)
+                    )
+                    conn.commit()
+                    applied.append(f"{version:04d}_{name}")
+            finally:
+                conn.rollback()
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_KEY,))
+                conn.commit()
+        return applied
+    finally:
+        release_connection(conn)
+
+def build_pending_indexes() -> list:
+    """
+    Build the indexes that pending migrations create on existing tables with
+    CREATE INDEX CONCURRENTLY, which does not block writes, so that `apply` finds them
+    and skips its blocking build. Indexes on columns that the migration itself adds are
+    left to `apply`. An invalid index left by an interrupted build is built again.
+    Returns the names of the built indexes.
+    """
+    built = []
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            done = get_applied_versions(cursor)
+            conn.commit()
+            conn.autocommit = True
+            for version, name, path in list_migrations():
+                if version in done:
+                    continue
+                with open(path, "r") as f:
+                    statements = INDEX_STATEMENT.findall(f.read())
+                for unique, index, table, definition in statements:
+                    cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS table_exists", (table,))
+                    if not cursor.fetchone()["table_exists"]:
+                        continue
+                    cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (index,))
+                    existing = cursor.fetchone()
+                    if existing is not None and existing["indisvalid"]:
+                        continue
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index}")
+                    logging.info(f"Building index {index} of migration {version:04d}_{name}")
+                    try:
+                        cursor.execute(f"CREATE {unique}INDEX CONCURRENTLY {index} ON {table}{definition}")
+                        built.append(index)
+                    except psycopg2.Error as e:
+                        # A failed concurrent build leaves an invalid index that `apply` would skip
+                        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index}")
+                        logging.warning(f"Index {index} left to apply: {str(e).strip()}")
+        return built
+    finally:
+        conn.autocommit = False
+        release_connection(conn)
+
+def migration_status() -> list:
+    """
+    Return the (version, name, applied) state of every migration.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            done = get_applied_versions(cursor)
+        conn.commit()
+        return [(version, name, version in done) for version, name, _ in list_migrations()]
+    finally:
+        release_connection(conn)
+
+def _plan_node_types(plan: dict) -> set:
+    node_types = {plan["Node Type"]}
+    for child in plan.get("Plans", []):
+        node_types |= _plan_node_types(child)
+    return node_types
+
+def check_query_plans(force_index: bool = True) -> dict:
+    """
+    EXPLAIN every hot query and report whether its plan uses an index.
+    On small tables the planner prefers sequential scans, so by default they are
+    disabled for the check to verify that a usable index exists.
+    """
+    report = {}
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            if force_index:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            for name, (query, params) in HOT_QUERIES.items():
+                cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+                plan = cursor.fetchone()["QUERY PLAN"][0]["Plan"]
+                node_types = _plan_node_types(plan)
+                report[name] = {
+                    "uses_index": bool(node_types & INDEX_NODE_TYPES) and "Seq Scan" not in node_types,
+                    "nodes": sorted(node_types),
+                }
+        return report
+    finally:
+        release_connection(conn)
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else "apply"
+    if command == "apply":
+        applied = apply_migrations()
+        print(f"Applied {len(applied)} migration(s): {', '.join(applied) or '-'}")
+    elif command == "build-indexes":
+        built = build_pending_indexes()
+        print(f"Built {len(built)} index(es): {', '.join(built) or '-'}")
+    elif command == "status":
+        for version, name, done in migration_status():
+            print(f"{version:04d}_{name}: {'applied' if done else 'pending'}")
+    elif command == "explain":
+        report = check_query_plans()
+        for name, result in report.items():
+            print(f"{name}: {'OK' if result['uses_index'] else 'NO INDEX'} ({', '.join(result['nodes'])})")
+        sys.exit(0 if all(r["uses_index"] for r in report.values()) else 1)
+    elif command == "compress-payloads":
+        total = 0
+        while converted := compress_legacy_payloads():
+            total += converted
+        print(f"Compressed {total} legacy result payload(s)")
+    elif command == "extract-findings":
+        total, after_id = 0, 0
+        while True:
+            scanned, after_id = extract_missing_findings(after_id)
+            if not scanned:
+                break
+            total += scanned
+        print(f"Extracted the findings of {total} result(s)")
+    else:
+        print("Usage: python migrate.py [apply|build-indexes|status|explain|compress-payloads|extract-findings]")
+        sys.exit(2)
@@ -0,0 +1,46 @@
+-- Baseline schema: the tables of db_schema.db plus the columns and indexes added
+-- before migrations were versioned. Safe to run on an existing database.
+CREATE TABLE IF NOT EXISTS backgroundcheck_user (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(255) NOT NULL UNIQUE,
+    password VARCHAR(255),
+    credits INTEGER DEFAULT 0,
+    request_counter INTEGER DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS backgroundcheck_requests (
+    id SERIAL PRIMARY KEY,
+    userid INTEGER REFERENCES backgroundcheck_user(id),
+    document VARCHAR(100) NOT NULL,
+    typedoc VARCHAR(50) NOT NULL,
+    payload JSONB,
+    jobid VARCHAR(100) NOT NULL,
+    status VARCHAR(100) NOT NULL,
+    timestamp TIMESTAMP DEFAULT NOW(),
+    response_code INTEGER,
+    response_content TEXT,
+    status_response TEXT,
+    result_id VARCHAR(100)
+);
+
+CREATE TABLE IF NOT EXISTS backgroundcheck_results (
+    id SERIAL PRIMARY KEY,
+    checkid INTEGER REFERENCES backgroundcheck_requests(id),
+    document VARCHAR(100) NOT NULL,
+    jobid VARCHAR(100) NOT NULL,
+    hallazgos_altos INTEGER,
+    hallazgos_medios INTEGER,
+    hallazgos_bajos INTEGER,
+    response_payload TEXT,
+    timestamp TIMESTAMP DEFAULT NOW()
+);
+
+-- Scheduling of upstream status polling
+ALTER TABLE backgroundcheck_requests ADD COLUMN IF NOT EXISTS next_poll_at TIMESTAMP;
+ALTER TABLE backgroundcheck_requests ADD COLUMN IF NOT EXISTS poll_failures INTEGER DEFAULT 0;
+
+-- Keyset pagination and filters of getUserChecks
+CREATE INDEX IF NOT EXISTS idx_requests_user_timestamp ON backgroundcheck_requests (userid, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_requests_user_status_timestamp ON backgroundcheck_requests (userid, status, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_requests_user_typedoc_timestamp ON backgroundcheck_requests (userid, typedoc, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_requests_user_document ON backgroundcheck_requests (userid, document varchar_pattern_ops);
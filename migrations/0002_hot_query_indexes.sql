@@ -0,0 +1,26 @@
+-- Pending checks: get_pending_checks, get_processing_status and the sync scheduler
+CREATE INDEX IF NOT EXISTS idx_requests_procesando_user ON backgroundcheck_requests (userid) WHERE status = 'procesando';
+CREATE INDEX IF NOT EXISTS idx_requests_procesando_next_poll ON backgroundcheck_requests (next_poll_at) WHERE status = 'procesando';
+
+-- Finalized checks: get_outdated_results
+CREATE INDEX IF NOT EXISTS idx_requests_finalizado_user ON backgroundcheck_requests (userid, id) WHERE status = 'finalizado';
+
+-- One result row per check. Result payloads are never deleted by a migration: checks with
+-- several result rows abort it with their checkids, to be resolved by hand before re-running it.
+DO $$
+DECLARE
+    duplicates INTEGER;
+    sample INTEGER[];
+BEGIN
+    SELECT COUNT(*), (array_agg(checkid ORDER BY checkid))[1:20] INTO duplicates, sample
+    FROM (SELECT checkid FROM backgroundcheck_results
+          WHERE checkid IS NOT NULL GROUP BY checkid HAVING COUNT(*) > 1) d;
+    IF duplicates > 0 THEN
+        RAISE EXCEPTION '% check(s) have more than one row in backgroundcheck_results (first checkids: %)',
+            duplicates, array_to_string(sample, ', ')
+            USING HINT = 'Archive or remove the extra result rows of these checks, then apply the migration again.';
+    END IF;
+END;
+$$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_results_checkid ON backgroundcheck_results (checkid);
@@ -0,0 +1,4 @@
+-- gzip-compressed result payloads, the legacy TEXT column is kept for rows not yet converted
+ALTER TABLE backgroundcheck_results ADD COLUMN IF NOT EXISTS response_payload_gz BYTEA;
+-- Already compressed: store out of line without a second TOAST compression pass
+ALTER TABLE backgroundcheck_results ALTER COLUMN response_payload_gz SET STORAGE EXTERNAL;
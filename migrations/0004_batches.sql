@@ -0,0 +1,24 @@
+-- Asynchronous batch submissions (BatchCheckRequest) and their individual checks
+CREATE TABLE IF NOT EXISTS backgroundcheck_batches (
+    id VARCHAR(36) PRIMARY KEY,
+    userid INTEGER REFERENCES backgroundcheck_user(id),
+    country VARCHAR(10) NOT NULL,
+    legal_representative JSONB,
+    status VARCHAR(100) NOT NULL,
+    total INTEGER NOT NULL,
+    timestamp TIMESTAMP DEFAULT NOW(),
+    launched_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS backgroundcheck_batch_items (
+    batch_id VARCHAR(36) NOT NULL REFERENCES backgroundcheck_batches(id),
+    position INTEGER NOT NULL,
+    payload JSONB NOT NULL,
+    status VARCHAR(100) NOT NULL DEFAULT 'pendiente',
+    checkid INTEGER REFERENCES backgroundcheck_requests(id),
+    claimed_at TIMESTAMP,
+    PRIMARY KEY (batch_id, position)
+);
+
+CREATE INDEX IF NOT EXISTS idx_batch_items_pending ON backgroundcheck_batch_items (batch_id, position) WHERE status IN ('pendiente', 'lanzando');
+CREATE INDEX IF NOT EXISTS idx_batches_user ON backgroundcheck_batches (userid, timestamp DESC);
@@ -0,0 +1,21 @@
+-- Wakes the checkUpdates long-poll: every new check and every status change notifies the
+-- listeners of its owner on the check_status channel. NOTIFY is delivered at commit, so a
+-- listener re-reads the feed only once the change is visible. The trigger only notifies,
+-- it does not write to the row it fires on.
+CREATE OR REPLACE FUNCTION notify_check_status() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('check_status', COALESCE(NEW.userid, 0)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_check_status_inserted ON backgroundcheck_requests;
+CREATE TRIGGER trg_check_status_inserted
+    AFTER INSERT ON backgroundcheck_requests
+    FOR EACH ROW EXECUTE FUNCTION notify_check_status();
+
+DROP TRIGGER IF EXISTS trg_check_status_changed ON backgroundcheck_requests;
+CREATE TRIGGER trg_check_status_changed
+    AFTER UPDATE OF status ON backgroundcheck_requests
+    FOR EACH ROW WHEN (NEW.status IS DISTINCT FROM OLD.status)
+    EXECUTE FUNCTION notify_check_status();
@@ -0,0 +1,5 @@
+-- Time of the last listed change of a check or of its result, stamped by the change feed
+-- triggers (0012). Rows written before are left NULL: a nullable column without a default is
+-- added without rewriting the tables.
+ALTER TABLE backgroundcheck_requests ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+ALTER TABLE backgroundcheck_results ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
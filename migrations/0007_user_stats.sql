@@ -0,0 +1,131 @@
+-- Per-user, per-day aggregates behind getUserStats: checks per status and typedoc, and the
+-- hallazgos of their results. Kept up to date in the writing transaction by statement-level
+-- triggers, which apply the net change of each statement in key order (so concurrent writers
+-- lock the summary rows in the same order and do not deadlock).
+CREATE TABLE IF NOT EXISTS backgroundcheck_user_stats (
+    userid INTEGER NOT NULL,
+    day DATE NOT NULL,
+    typedoc VARCHAR(50) NOT NULL,
+    status VARCHAR(100) NOT NULL,
+    checks INTEGER NOT NULL DEFAULT 0,
+    hallazgos_altos INTEGER NOT NULL DEFAULT 0,
+    hallazgos_medios INTEGER NOT NULL DEFAULT 0,
+    hallazgos_bajos INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (userid, day, typedoc, status)
+);
+
+-- Day of a check in Bogota time, as used by the getUserChecks date filters
+CREATE OR REPLACE FUNCTION check_stats_day(ts TIMESTAMP) RETURNS DATE AS $$
+    SELECT ((ts AT TIME ZONE 'UTC') AT TIME ZONE 'America/Bogota')::date
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Adds a set of deltas (userid, day, typedoc, status, checks, altos, medios, bajos) to the summary rows
+CREATE OR REPLACE FUNCTION add_user_stats(delta JSONB) RETURNS void AS $$
+    INSERT INTO backgroundcheck_user_stats AS s (userid, day, typedoc, status, checks, hallazgos_altos, hallazgos_medios, hallazgos_bajos)
+    SELECT userid, day, typedoc, status,
+           COALESCE(SUM(checks), 0), COALESCE(SUM(altos), 0), COALESCE(SUM(medios), 0), COALESCE(SUM(bajos), 0)
+    FROM jsonb_to_recordset(COALESCE(delta, '[]'::jsonb))
+         AS d(userid INTEGER, day DATE, typedoc VARCHAR, status VARCHAR, checks INTEGER, altos INTEGER, medios INTEGER, bajos INTEGER)
+    GROUP BY userid, day, typedoc, status
+    HAVING COALESCE(SUM(checks), 0) <> 0 OR COALESCE(SUM(altos), 0) <> 0
+        OR COALESCE(SUM(medios), 0) <> 0 OR COALESCE(SUM(bajos), 0) <> 0
+    ORDER BY userid, day, typedoc, status
+    ON CONFLICT (userid, day, typedoc, status) DO UPDATE
+    SET checks = s.checks + EXCLUDED.checks,
+        hallazgos_altos = s.hallazgos_altos + EXCLUDED.hallazgos_altos,
+        hallazgos_medios = s.hallazgos_medios + EXCLUDED.hallazgos_medios,
+        hallazgos_bajos = s.hallazgos_bajos + EXCLUDED.hallazgos_bajos
+$$ LANGUAGE sql;
+
+-- A transition table only exists for the events that produce it, hence one query per event
+CREATE OR REPLACE FUNCTION apply_request_stats() RETURNS trigger AS $$
+DECLARE
+    delta JSONB;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT jsonb_agg(d) INTO delta FROM (
+            SELECT COALESCE(userid, 0) AS userid, check_stats_day(timestamp) AS day, typedoc, status, 1 AS checks
+            FROM new_rows) d;
+    ELSIF TG_OP = 'UPDATE' THEN
+        -- A check moving to another summary row takes the hallazgos of its result along
+        SELECT jsonb_agg(d) INTO delta FROM (
+            SELECT COALESCE(n.userid, 0) AS userid, check_stats_day(n.timestamp) AS day, n.typedoc, n.status, 1 AS checks,
+                   res.hallazgos_altos AS altos, res.hallazgos_medios AS medios, res.hallazgos_bajos AS bajos
+            FROM new_rows n JOIN old_rows o ON o.id = n.id
+            LEFT JOIN backgroundcheck_results res ON res.checkid = n.id
+            WHERE (n.userid, n.timestamp, n.typedoc, n.status) IS DISTINCT FROM (o.userid, o.timestamp, o.typedoc, o.status)
+            UNION ALL
+            SELECT COALESCE(o.userid, 0), check_stats_day(o.timestamp), o.typedoc, o.status, -1,
+                   -res.hallazgos_altos, -res.hallazgos_medios, -res.hallazgos_bajos
+            FROM new_rows n JOIN old_rows o ON o.id = n.id
+            LEFT JOIN backgroundcheck_results res ON res.checkid = n.id
+            WHERE (n.userid, n.timestamp, n.typedoc, n.status) IS DISTINCT FROM (o.userid, o.timestamp, o.typedoc, o.status)) d;
+    ELSE
+        SELECT jsonb_agg(d) INTO delta FROM (
+            SELECT COALESCE(userid, 0) AS userid, check_stats_day(timestamp) AS day, typedoc, status, -1 AS checks
+            FROM old_rows) d;
+    END IF;
+    PERFORM add_user_stats(delta);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Hallazgos are counted in the summary row of their check
+CREATE OR REPLACE FUNCTION apply_result_stats() RETURNS trigger AS $$
+DECLARE
+    delta JSONB;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT jsonb_agg(d) INTO delta FROM (
+            SELECT COALESCE(r.userid, 0) AS userid, check_stats_day(r.timestamp) AS day, r.typedoc, r.status,
+                   n.hallazgos_altos AS altos, n.hallazgos_medios AS medios, n.hallazgos_bajos AS bajos
+            FROM new_rows n JOIN backgroundcheck_requests r ON r.id = n.checkid) d;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT jsonb_agg(d) INTO delta FROM (
+            SELECT COALESCE(r.userid, 0) AS userid, check_stats_day(r.timestamp) AS day, r.typedoc, r.status,
+                   COALESCE(n.hallazgos_altos, 0) - COALESCE(o.hallazgos_altos, 0) AS altos,
+                   COALESCE(n.hallazgos_medios, 0) - COALESCE(o.hallazgos_medios, 0) AS medios,
+                   COALESCE(n.hallazgos_bajos, 0) - COALESCE(o.hallazgos_bajos, 0) AS bajos
+            FROM new_rows n JOIN old_rows o ON o.id = n.id JOIN backgroundcheck_requests r ON r.id = n.checkid
+            WHERE (n.hallazgos_altos, n.hallazgos_medios, n.hallazgos_bajos)
+                  IS DISTINCT FROM (o.hallazgos_altos, o.hallazgos_medios, o.hallazgos_bajos)) d;
+    ELSE
+        SELECT jsonb_agg(d) INTO delta FROM (
+            SELECT COALESCE(r.userid, 0) AS userid, check_stats_day(r.timestamp) AS day, r.typedoc, r.status,
+                   -o.hallazgos_altos AS altos, -o.hallazgos_medios AS medios, -o.hallazgos_bajos AS bajos
+            FROM old_rows o JOIN backgroundcheck_requests r ON r.id = o.checkid) d;
+    END IF;
+    PERFORM add_user_stats(delta);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables require one trigger per event
+DROP TRIGGER IF EXISTS trg_request_stats_insert ON backgroundcheck_requests;
+CREATE TRIGGER trg_request_stats_insert AFTER INSERT ON backgroundcheck_requests
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION apply_request_stats();
+DROP TRIGGER IF EXISTS trg_request_stats_update ON backgroundcheck_requests;
+CREATE TRIGGER trg_request_stats_update AFTER UPDATE ON backgroundcheck_requests
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION apply_request_stats();
+DROP TRIGGER IF EXISTS trg_request_stats_delete ON backgroundcheck_requests;
+CREATE TRIGGER trg_request_stats_delete AFTER DELETE ON backgroundcheck_requests
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION apply_request_stats();
+
+DROP TRIGGER IF EXISTS trg_result_stats_insert ON backgroundcheck_results;
+CREATE TRIGGER trg_result_stats_insert AFTER INSERT ON backgroundcheck_results
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION apply_result_stats();
+DROP TRIGGER IF EXISTS trg_result_stats_update ON backgroundcheck_results;
+CREATE TRIGGER trg_result_stats_update AFTER UPDATE ON backgroundcheck_results
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION apply_result_stats();
+DROP TRIGGER IF EXISTS trg_result_stats_delete ON backgroundcheck_results;
+CREATE TRIGGER trg_result_stats_delete AFTER DELETE ON backgroundcheck_results
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION apply_result_stats();
+
+-- Backfill from the existing checks and results
+INSERT INTO backgroundcheck_user_stats (userid, day, typedoc, status, checks, hallazgos_altos, hallazgos_medios, hallazgos_bajos)
+SELECT COALESCE(r.userid, 0), check_stats_day(r.timestamp), r.typedoc, r.status, COUNT(*),
+       COALESCE(SUM(res.hallazgos_altos), 0), COALESCE(SUM(res.hallazgos_medios), 0), COALESCE(SUM(res.hallazgos_bajos), 0)
+FROM backgroundcheck_requests r
+LEFT JOIN backgroundcheck_results res ON res.checkid = r.id
+GROUP BY 1, 2, 3, 4
+ON CONFLICT (userid, day, typedoc, status) DO NOTHING;
@@ -0,0 +1,17 @@
+-- One row per hallazgo of a result (severity, source, description), extracted from the
+-- report_json payload when the result is saved, so findings can be searched without
+-- decoding the payloads. userid is denormalized for the per-user searches.
+CREATE TABLE IF NOT EXISTS backgroundcheck_findings (
+    id BIGSERIAL PRIMARY KEY,
+    resultid INTEGER NOT NULL REFERENCES backgroundcheck_results(id) ON DELETE CASCADE,
+    checkid INTEGER NOT NULL REFERENCES backgroundcheck_requests(id),
+    userid INTEGER,
+    severity VARCHAR(10) NOT NULL,
+    source VARCHAR(255),
+    description TEXT,
+    detail JSONB
+);
+
+CREATE INDEX IF NOT EXISTS idx_findings_result ON backgroundcheck_findings (resultid);
+CREATE INDEX IF NOT EXISTS idx_findings_user_severity ON backgroundcheck_findings (userid, severity, id DESC);
+CREATE INDEX IF NOT EXISTS idx_findings_user_source ON backgroundcheck_findings (userid, lower(source) varchar_pattern_ops, id DESC);
@@ -0,0 +1,2 @@
+-- Checks answered at launch with a finished result (or that failed to launch) have no job id
+ALTER TABLE backgroundcheck_requests ALTER COLUMN jobid DROP NOT NULL;
@@ -0,0 +1,2 @@
+-- Results of checks answered at launch with a finished result have no job id
+ALTER TABLE backgroundcheck_results ALTER COLUMN jobid DROP NOT NULL;
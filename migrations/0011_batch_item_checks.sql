@@ -0,0 +1,10 @@
+-- Links a stored check to the batch item it was launched for, so an item whose worker died
+-- after storing its check is marked launched instead of being launched (and charged) again.
+-- heartbeat_at is touched by every worker pass over a batch; batches left without one (e.g.
+-- after their queue message went to the poison queue) are re-queued by batchSweepTimer.
+ALTER TABLE backgroundcheck_requests ADD COLUMN IF NOT EXISTS batch_id VARCHAR(36);
+ALTER TABLE backgroundcheck_requests ADD COLUMN IF NOT EXISTS batch_position INTEGER;
+CREATE INDEX IF NOT EXISTS idx_requests_batch_item ON backgroundcheck_requests (batch_id, batch_position) WHERE batch_id IS NOT NULL;
+
+ALTER TABLE backgroundcheck_batches ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_batches_unfinished ON backgroundcheck_batches ((COALESCE(heartbeat_at, timestamp))) WHERE status IN ('pendiente', 'procesando');
@@ -0,0 +1,80 @@
+-- Change feeds of getUserChecks (`since` mode and ETags) and checkUpdates. BEFORE row triggers
+-- stamp every new check and every listed change with the id of the writing transaction
+-- (row_xid, and status_xid for status changes), so a write costs no second UPDATE and takes no
+-- shared lock. Readers only return changes of transactions older than their snapshot's xmin
+-- (pg_snapshot_xmin), which have all finished, so a cursor never skips a transaction that
+-- commits late. Status changes are notified by the triggers of 0005. Requires PostgreSQL 13+.
+
+-- Existing rows count as changed before any cursor; a constant default does not rewrite the table
+ALTER TABLE backgroundcheck_requests ADD COLUMN IF NOT EXISTS row_xid xid8 NOT NULL DEFAULT '0';
+ALTER TABLE backgroundcheck_requests ADD COLUMN IF NOT EXISTS status_xid xid8 NOT NULL DEFAULT '0';
+CREATE INDEX IF NOT EXISTS idx_requests_user_row_xid ON backgroundcheck_requests (userid, row_xid, id);
+CREATE INDEX IF NOT EXISTS idx_requests_user_status_xid ON backgroundcheck_requests (userid, status_xid, id);
+
+CREATE OR REPLACE FUNCTION stamp_check_change() RETURNS trigger AS $$
+BEGIN
+    NEW.row_xid := pg_current_xact_id();
+    NEW.updated_at := NOW();
+    IF TG_OP = 'INSERT' OR NEW.status IS DISTINCT FROM OLD.status THEN
+        NEW.status_xid := NEW.row_xid;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stamp_result_change() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- A new or changed result also changes the listed check (hallazgos): one UPDATE per statement
+CREATE OR REPLACE FUNCTION touch_result_checks() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE backgroundcheck_requests r SET row_xid = pg_current_xact_id(), updated_at = NOW()
+        FROM (SELECT DISTINCT checkid FROM new_rows) n
+        WHERE r.id = n.checkid;
+    ELSE
+        UPDATE backgroundcheck_requests r SET row_xid = pg_current_xact_id(), updated_at = NOW()
+        FROM (SELECT DISTINCT n.checkid FROM new_rows n JOIN old_rows o ON o.id = n.id
+              WHERE (n.hallazgos_altos, n.hallazgos_medios, n.hallazgos_bajos)
+                    IS DISTINCT FROM (o.hallazgos_altos, o.hallazgos_medios, o.hallazgos_bajos)) n
+        WHERE r.id = n.checkid;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_check_stamp_insert ON backgroundcheck_requests;
+CREATE TRIGGER trg_check_stamp_insert
+    BEFORE INSERT ON backgroundcheck_requests
+    FOR EACH ROW EXECUTE FUNCTION stamp_check_change();
+
+DROP TRIGGER IF EXISTS trg_check_stamp_update ON backgroundcheck_requests;
+CREATE TRIGGER trg_check_stamp_update
+    BEFORE UPDATE OF status, result_id, jobid, response_code, document, typedoc ON backgroundcheck_requests
+    FOR EACH ROW WHEN ((NEW.status, NEW.result_id, NEW.jobid, NEW.response_code, NEW.document, NEW.typedoc)
+                       IS DISTINCT FROM (OLD.status, OLD.result_id, OLD.jobid, OLD.response_code, OLD.document, OLD.typedoc))
+    EXECUTE FUNCTION stamp_check_change();
+
+DROP TRIGGER IF EXISTS trg_result_stamp_insert ON backgroundcheck_results;
+CREATE TRIGGER trg_result_stamp_insert
+    BEFORE INSERT ON backgroundcheck_results
+    FOR EACH ROW EXECUTE FUNCTION stamp_result_change();
+
+DROP TRIGGER IF EXISTS trg_result_stamp_update ON backgroundcheck_results;
+CREATE TRIGGER trg_result_stamp_update
+    BEFORE UPDATE OF hallazgos_altos, hallazgos_medios, hallazgos_bajos ON backgroundcheck_results
+    FOR EACH ROW WHEN ((NEW.hallazgos_altos, NEW.hallazgos_medios, NEW.hallazgos_bajos)
+                       IS DISTINCT FROM (OLD.hallazgos_altos, OLD.hallazgos_medios, OLD.hallazgos_bajos))
+    EXECUTE FUNCTION stamp_result_change();
+
+-- Transition tables require one trigger per event
+DROP TRIGGER IF EXISTS trg_result_touch_insert ON backgroundcheck_results;
+CREATE TRIGGER trg_result_touch_insert AFTER INSERT ON backgroundcheck_results
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION touch_result_checks();
+DROP TRIGGER IF EXISTS trg_result_touch_update ON backgroundcheck_results;
+CREATE TRIGGER trg_result_touch_update AFTER UPDATE ON backgroundcheck_results
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION touch_result_checks();
@@ -0,0 +1,4 @@
+-- Finalized checks whose results could not be fetched (or stored) are retried with backoff,
+-- like pending checks are polled (poll_failures/next_poll_at), instead of on every sync cycle
+ALTER TABLE backgroundcheck_requests ADD COLUMN IF NOT EXISTS result_fetch_failures INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE backgroundcheck_requests ADD COLUMN IF NOT EXISTS next_fetch_at TIMESTAMP;
@@ -0,0 +1,28 @@
+-- Finalized checks whose results are stored are flagged, so the sync worker finds the few checks
+-- still missing results through a small partial index instead of walking the finalized history
+-- and probing backgroundcheck_results for every row. The flag is set in the transaction that
+-- inserts the result, by the statement trigger that already touches its check (0012).
+ALTER TABLE backgroundcheck_requests ADD COLUMN IF NOT EXISTS results_fetched BOOLEAN NOT NULL DEFAULT FALSE;
+
+UPDATE backgroundcheck_requests r SET results_fetched = TRUE
+WHERE NOT r.results_fetched AND EXISTS (SELECT 1 FROM backgroundcheck_results res WHERE res.checkid = r.id);
+
+CREATE INDEX IF NOT EXISTS idx_requests_finalizado_unfetched ON backgroundcheck_requests (id)
+    WHERE status = 'finalizado' AND NOT results_fetched;
+
+CREATE OR REPLACE FUNCTION touch_result_checks() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE backgroundcheck_requests r SET row_xid = pg_current_xact_id(), updated_at = NOW(), results_fetched = TRUE
+        FROM (SELECT DISTINCT checkid FROM new_rows) n
+        WHERE r.id = n.checkid;
+    ELSE
+        UPDATE backgroundcheck_requests r SET row_xid = pg_current_xact_id(), updated_at = NOW()
+        FROM (SELECT DISTINCT n.checkid FROM new_rows n JOIN old_rows o ON o.id = n.id
+              WHERE (n.hallazgos_altos, n.hallazgos_medios, n.hallazgos_bajos)
+                    IS DISTINCT FROM (o.hallazgos_altos, o.hallazgos_medios, o.hallazgos_bajos)) n
+        WHERE r.id = n.checkid;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,54 @@
+import os
+import gzip
+import json
+
+# gzip keeps the stored bytes servable as-is with Content-Encoding: gzip
+PAYLOAD_COMPRESSION_LEVEL = int(os.environ.get("PAYLOAD_COMPRESSION_LEVEL", 6))
+
+def compress_payload(payload) -> bytes:
+    """
+    Serialize a payload to JSON and gzip it for storage.
+    Strings are assumed to already hold JSON.
+    """
+    data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+    return gzip.compress(data.encode("utf-8"), compresslevel=PAYLOAD_COMPRESSION_LEVEL, mtime=0)
+
+def decompress_payload(data) -> str:
+    """
+    Decode a stored gzip payload back to its JSON text.
+    """
+    return gzip.decompress(bytes(data)).decode("utf-8")
+
+def load_payload(row: dict, column: str = "response_payload") -> str:
+    """
+    Return the JSON text of a payload column, reading the compressed
+    `<column>_gz` variant when present and the legacy TEXT column otherwise.
+    """
+    compressed = row.get(f"{column}_gz")
+    if compressed is not None:
+        return decompress_payload(compressed)
+    return row.get(column)
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Whether an Accept-Encoding header allows a gzip response body.
+    An explicit gzip entry decides, `*` only applies when gzip is not listed.
+    """
+    weights = {}
+    for coding in (accept_encoding or "").split(","):
+        name, *params = coding.split(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value.strip())
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    if "gzip" in weights:
+        return weights["gzip"] > 0
+    return weights.get("*", 0) > 0
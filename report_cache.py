@@ -0,0 +1,219 @@
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Reports are immutable once a check is finalized, so they are cached without expiry
+REPORT_CACHE_DIR = os.environ.get("REPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "sampink_report_cache"))
+REPORT_CACHE_MAX_BYTES = int(os.environ.get("REPORT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+REPORT_CACHE_HOT_MAX_BYTES = int(os.environ.get("REPORT_CACHE_HOT_MAX_BYTES", 64 * 1024 * 1024))
+# Larger reports are only kept on disk
+REPORT_CACHE_HOT_MAX_ITEM_BYTES = int(os.environ.get("REPORT_CACHE_HOT_MAX_ITEM_BYTES", 4 * 1024 * 1024))
+
+def report_key(result_id, fmt: str, typedoc: str = None) -> str:
+    """
+    Content address of a report: a hash of (result_id, format, typedoc).
+    """
+    raw = f"{result_id}:{fmt.lower()}:{(typedoc or '').lower()}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ReportCache:
+    """
+    Two-tier LRU cache of report bodies: a bounded in-process hot tier in front of a
+    size-bounded disk tier. Reports are streamed to disk on a miss and can be read back
+    by byte range. Concurrent misses for the same key share a single fetch.
+    """
+    def __init__(self, directory: str = REPORT_CACHE_DIR, max_bytes: int = REPORT_CACHE_MAX_BYTES,
+                 hot_max_bytes: int = REPORT_CACHE_HOT_MAX_BYTES, hot_max_item_bytes: int = REPORT_CACHE_HOT_MAX_ITEM_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hot_max_bytes = hot_max_bytes
+        self.hot_max_item_bytes = hot_max_item_bytes
+        self._hot = OrderedDict()
+        self._hot_bytes = 0
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+        self._inflight = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _hot_put(self, key: str, data: bytes):
+        if len(data) > self.hot_max_item_bytes:
+            return
+        with self._lock:
+            if key in self._hot:
+                self._hot_bytes -= len(self._hot.pop(key))
+            self._hot[key] = data
+            self._hot_bytes += len(data)
+            while self._hot_bytes > self.hot_max_bytes:
+                _, evicted = self._hot.popitem(last=False)
+                self._hot_bytes -= len(evicted)
+
+    def size(self, key: str) -> int:
+        """
+        Size in bytes of a cached report, None when it is not cached.
+        """
+        with self._lock:
+            data = self._hot.get(key)
+            if data is not None:
+                return len(data)
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            return None
+
+    def read(self, key: str, start: int = 0, length: int = None) -> bytes:
+        """
+        Read a cached report, or the `length` bytes starting at `start`.
+        Returns None when it is not cached.
+        """
+        with self._lock:
+            data = self._hot.get(key)
+            if data is not None:
+                self._hot.move_to_end(key)
+                return data[start:start + length] if length is not None else data[start:]
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                f.seek(start)
+                data = f.read(length) if length is not None else f.read()
+            os.utime(path)  # mark as recently used for the disk LRU
+        except FileNotFoundError:
+            return None
+        if start == 0 and length is None:
+            self._hot_put(key, data)
+        return data
+
+    def iter_chunks(self, key: str, chunk_size: int = 64 * 1024):
+        """
+        Iterate over a cached report in chunks without loading it whole.
+        Raises KeyError when it is not cached.
+        """
+        with self._lock:
+            data = self._hot.get(key)
+        if data is not None:
+            for start in range(0, len(data), chunk_size):
+                yield data[start:start + chunk_size]
+            return
+        try:
+            f = open(self._path(key), "rb")
+        except FileNotFoundError:
+            raise KeyError(key)
+        with f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def _write(self, key: str, chunks) -> int:
+        path = self._path(key)
+        # Unique across the threads and the worker processes sharing the directory
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f"{key}.", suffix=".tmp")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+                        size += len(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self._account_disk(size)
+        return size
+
+    def _account_disk(self, added: int):
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(entry.stat().st_size for entry in os.scandir(self.directory)
+                                       if entry.is_file() and not entry.name.endswith(".tmp"))
+            else:
+                self._disk_bytes += added
+            if self._disk_bytes > self.max_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        entries = [entry for entry in os.scandir(self.directory) if entry.is_file() and not entry.name.endswith(".tmp")]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except FileNotFoundError:
+                continue
+        self._disk_bytes = total
+        logging.info(f"Report cache evicted down to {total} bytes")
+
+    def ensure(self, key: str, fetch_chunks) -> int:
+        """
+        Make sure the report for `key` is cached, streaming it to disk chunk by chunk from
+        the iterable returned by `fetch_chunks()` on a miss. Only one fetch per key runs at
+        a time; concurrent callers wait for its result.
+        Returns the report size, or None when `fetch_chunks()` returns None.
+        """
+        size = self.size(key)
+        if size is not None:
+            return size
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = {"event": threading.Event(), "size": None, "error": None}
+
+        if not leader:
+            flight["event"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            return flight["size"]
+
+        try:
+            # A previous flight may have completed between the first lookup and taking the lock
+            size = self.size(key)
+            if size is None:
+                chunks = fetch_chunks()
+                if chunks is not None:
+                    size = self._write(key, chunks)
+            flight["size"] = size
+            return size
+        except Exception as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight["event"].set()
+
+    def read_or_fetch(self, key: str, fetch_chunks, start: int = 0, length: int = None) -> bytes:
+        """
+        Like read, but a report evicted since it was ensured is fetched again with `fetch_chunks()`.
+        Returns None when it cannot be fetched or is evicted again before it is read.
+        """
+        data = self.read(key, start, length)
+        if data is None and self.ensure(key, fetch_chunks) is not None:
+            data = self.read(key, start, length)
+        return data
+
+_cache: ReportCache = None
+_cache_lock = threading.Lock()
+
+def get_report_cache() -> ReportCache:
+    """
+    Return the process-wide report cache, creating it on first use.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ReportCache()
+    return _cache
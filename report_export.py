@@ -0,0 +1,130 @@
+import os
+import re
+import json
+import shutil
+import zipfile
+import tempfile
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from report_cache import get_report_cache, report_key
+from tusdatos_client import launch_report_pdf, iter_report_chunks, TUSDATOS_MAX_WORKERS
+
+# Maximum number of checks in one export
+EXPORT_MAX_CHECKS = int(os.environ.get("EXPORT_MAX_CHECKS", 100))
+# The HTTP response body is held in memory, so the reports of one archive are capped at this size
+EXPORT_MAX_BYTES = int(os.environ.get("EXPORT_MAX_BYTES", 64 * 1024 * 1024))
+# Reason listed in the manifest for the checks left out of a full archive
+EXPORT_LIMIT_REASON = "Export size limit reached, export this check separately"
+# Reports larger than this are staged in a temporary file before being added to the archive
+EXPORT_SPOOL_MAX_BYTES = int(os.environ.get("EXPORT_SPOOL_MAX_BYTES", 16 * 1024 * 1024))
+
+def _archive_name(check: dict) -> str:
+    document = re.sub(r"[^\w.-]", "_", str(check['document']))
+    return f"{check['id']}_{check['typedoc']}_{document}.pdf"
+
+def _ensure_pdf(check: dict) -> int:
+    result_id = check['result_id']
+    type_doc = check['typedoc']
+    return get_report_cache().ensure(
+        report_key(result_id, 'pdf', type_doc),
+        lambda: iter_report_chunks(launch_report_pdf(result_id, type_doc, stream=True)))
+
+def _stage_pdf(check: dict, size: int, staging):
+    """
+    Copy a cached report into `staging`, fetching it again if it was evicted meanwhile.
+    Raises ValueError unless the whole report was copied.
+    """
+    key = report_key(check['result_id'], 'pdf', check['typedoc'])
+    cache = get_report_cache()
+    try:
+        copied = sum(staging.write(chunk) for chunk in cache.iter_chunks(key))
+    except KeyError:
+        staging.seek(0)
+        staging.truncate()
+        size = _ensure_pdf(check)
+        if size is None:
+            raise ValueError("Could not fetch the report from the provider")
+        copied = sum(staging.write(chunk) for chunk in cache.iter_chunks(key))
+    if copied != size:
+        raise ValueError(f"Incomplete report: {copied} of {size} bytes")
+    staging.seek(0)
+    return size
+
+def export_reports_zip(checks: list, out_file, requested_ids: list = None, max_workers: int = None,
+                       max_bytes: int = None) -> dict:
+    """
+    Write the PDF reports of `checks` into a ZIP archive on `out_file`.
+    Reports are fetched concurrently through the report cache, at most max_workers ahead of
+    the one being added, then added in check order, each one staged first and only added to
+    the archive once complete, so a failed read does not leave a truncated entry. The archive
+    is full once a report would take it past max_bytes (EXPORT_MAX_BYTES by default): the
+    remaining reports are not fetched. Checks that cannot be exported are listed, with the
+    reason, in the manifest.json entry of the archive.
+    Returns the manifest.
+    """
+    max_bytes = EXPORT_MAX_BYTES if max_bytes is None else max_bytes
+    max_workers = max_workers or TUSDATOS_MAX_WORKERS
+    manifest = {"generated_at": datetime.now(timezone.utc).isoformat(), "exported": [], "failed": []}
+
+    if requested_ids is not None:
+        found = {check['id'] for check in checks}
+        for check_id in requested_ids:
+            if check_id not in found:
+                manifest["failed"].append({"check_id": check_id, "reason": "Check not found"})
+
+    exportable = []
+    for check in checks:
+        if check['status'] != 'finalizado' or not check['result_id']:
+            manifest["failed"].append({"check_id": check['id'], "document": check['document'],
+                                       "reason": "Check is not yet finalized or result ID is missing"})
+        else:
+            exportable.append(check)
+
+    # PDFs are already compressed, storing them avoids spending CPU for nothing
+    with zipfile.ZipFile(out_file, "w", compression=zipfile.ZIP_STORED) as archive:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            remaining = iter(exportable)
+            in_flight = deque()
+            total = 0
+            full = False
+            while True:
+                # Downloads are submitted as the archive advances, so a full archive stops them
+                while not full and len(in_flight) < max_workers and (check := next(remaining, None)) is not None:
+                    in_flight.append((executor.submit(_ensure_pdf, check), check))
+                if not in_flight:
+                    break
+                future, check = in_flight.popleft()
+                if full:
+                    future.cancel()
+                    manifest["failed"].append({"check_id": check['id'], "document": check['document'],
+                                               "reason": EXPORT_LIMIT_REASON})
+                    continue
+                try:
+                    size = future.result()
+                    if size is None:
+                        raise ValueError("Could not fetch the report from the provider")
+                    if total + size > max_bytes:
+                        full = True
+                        raise ValueError(EXPORT_LIMIT_REASON)
+                    name = _archive_name(check)
+                    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES) as staging:
+                        size = _stage_pdf(check, size, staging)
+                        with archive.open(name, "w", force_zip64=True) as entry:
+                            shutil.copyfileobj(staging, entry)
+                    total += size
+                    manifest["exported"].append({"check_id": check['id'], "document": check['document'],
+                                                 "file": name, "size": size})
+                except Exception as e:
+                    logging.error(f"Error exporting report for check_id {check['id']}: {e}")
+                    manifest["failed"].append({"check_id": check['id'], "document": check['document'], "reason": str(e)})
+
+            for check in remaining:
+                manifest["failed"].append({"check_id": check['id'], "document": check['document'],
+                                           "reason": EXPORT_LIMIT_REASON})
+
+        manifest["exported"].sort(key=lambda item: item["check_id"])
+        manifest["failed"].sort(key=lambda item: item["check_id"])
+        archive.writestr("manifest.json", json.dumps(manifest, indent=4, ensure_ascii=False))
+    return manifest
@@ -0,0 +1,145 @@
+import os
+import time
+import select
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from db_operations import connect_db, get_check_changes
+
+# Channel notified (with the owner's user id) whenever a check is created or changes status
+STATUS_CHANNEL = "check_status"
+# Longest a checkUpdates call waits for a change, kept well below the HTTP timeout
+LONGPOLL_MAX_SECONDS = float(os.environ.get("LONGPOLL_MAX_SECONDS", 25))
+# Waiters re-check the database this often while the listener connection is down
+LONGPOLL_FALLBACK_SECONDS = float(os.environ.get("LONGPOLL_FALLBACK_SECONDS", 5))
+LISTENER_RECONNECT_SECONDS = 5
+
+class StatusListener:
+    """
+    LISTENs on STATUS_CHANNEL with a dedicated connection (outside the pool) in a
+    daemon thread and wakes up the waiters subscribed to the notified user. Waiters are
+    asyncio events, set on their own event loop, so a waiting request holds no thread.
+    """
+    def __init__(self):
+        self.connected = False
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="status-listener", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = connect_db()
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {STATUS_CHANNEL}")
+                self.connected = True
+                logging.info(f"Listening for check status changes on {STATUS_CHANNEL}")
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    user_ids = set()
+                    while conn.notifies:
+                        user_ids.add(conn.notifies.pop(0).payload)
+                    for user_id in user_ids:
+                        self._wake(user_id)
+            except (psycopg2.Error, OSError) as e:
+                logging.warning(f"Check status listener disconnected: {e}")
+            finally:
+                self.connected = False
+                if conn is not None and not conn.closed:
+                    conn.close()
+            # Notifications may have been missed, let every waiter re-check
+            self._wake_all()
+            time.sleep(LISTENER_RECONNECT_SECONDS)
+
+    def _wake(self, user_id: str):
+        with self._lock:
+            waiters = list(self._waiters.get(str(user_id), ()))
+        self._set(waiters)
+
+    def _wake_all(self):
+        with self._lock:
+            waiters = [waiter for waiters in self._waiters.values() for waiter in waiters]
+        self._set(waiters)
+
+    @staticmethod
+    def _set(waiters: list):
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The waiter's loop was closed while it was unsubscribing
+                pass
+
+    @contextmanager
+    def subscribe(self, user_id):
+        """
+        Yield an asyncio Event, bound to the running loop, that is set whenever a check
+        of `user_id` changes status.
+        """
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        key = str(user_id)
+        with self._lock:
+            self._waiters.setdefault(key, set()).add(waiter)
+        try:
+            yield event
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(key)
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[key]
+
+_listener: StatusListener = None
+_listener_lock = threading.Lock()
+
+def get_status_listener() -> StatusListener:
+    """
+    Return the process-wide status listener, starting it on first use.
+    """
+    global _listener
+    if _listener is None:
+        with _listener_lock:
+            if _listener is None:
+                _listener = StatusListener()
+                _listener.start()
+    return _listener
+
+async def wait_for_check_changes(user_id: int, since: str, timeout: float = LONGPOLL_MAX_SECONDS) -> tuple:
+    """
+    Return the checks of a user whose status changed after the `since` cursor, waiting up to
+    `timeout` seconds for a change when there is none yet, and the next cursor.
+    Only the database reads run in a thread; the wait itself does not block one.
+    """
+    listener = get_status_listener()
+    deadline = time.monotonic() + min(timeout, LONGPOLL_MAX_SECONDS)
+    woken = False
+    with listener.subscribe(user_id) as event:
+        while True:
+            # Cleared before reading so a notification arriving meanwhile is not lost
+            event.clear()
+            changes, next_cursor = await asyncio.to_thread(get_check_changes, user_id, since)
+            remaining = deadline - time.monotonic()
+            if changes or remaining <= 0:
+                return changes, next_cursor
+            # A notified change is only read once every older transaction has finished, which
+            # is not notified, so after a wake-up the database is re-checked periodically
+            wait = remaining if listener.connected and not woken else min(remaining, LONGPOLL_FALLBACK_SECONDS)
+            try:
+                await asyncio.wait_for(event.wait(), wait)
+                woken = True
+            except asyncio.TimeoutError:
+                pass
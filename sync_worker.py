@@ -0,0 +1,71 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from db_operations import claim_due_checks, update_check_states, get_outdated_results
+from tusdatos_client import poll_check, update_pending_results, upstream_available, TUSDATOS_MAX_WORKERS
+
+# Number of pending checks claimed per scheduling round
+SYNC_BATCH_SIZE = int(os.environ.get("SYNC_BATCH_SIZE", 200))
+# Time a claimed check is hidden from other workers while it is being polled
+SYNC_LEASE_SECONDS = float(os.environ.get("SYNC_LEASE_SECONDS", 120))
+# Upper bound for the time spent polling in a single timer invocation
+SYNC_MAX_CYCLE_SECONDS = float(os.environ.get("SYNC_MAX_CYCLE_SECONDS", 240))
+SYNC_MAX_DELAY_SECONDS = float(os.environ.get("SYNC_MAX_DELAY_SECONDS", 1800))
+
+# (max job age in seconds, delay in seconds between polls): young jobs are polled often,
+# old jobs progressively less
+POLL_SCHEDULE = [
+    (120, 15),
+    (600, 60),
+    (3600, 300),
+    (None, 900),
+]
+
+def next_poll_delay(age_seconds: float, failures: int = 0) -> float:
+    """
+    Seconds to wait before polling a job again, based on its age and consecutive failed polls.
+    """
+    age_seconds = age_seconds or 0
+    delay = next(d for max_age, d in POLL_SCHEDULE if max_age is None or age_seconds < max_age)
+    if failures:
+        delay = delay * 2 ** min(failures, 10)
+    return min(delay, SYNC_MAX_DELAY_SECONDS)
+
+def run_sync_cycle() -> dict:
+    """
+    Poll every pending check whose next poll is due, then fetch results for finalized checks.
+    """
+    started = time.monotonic()
+    polled = 0
+    state_changed = False
+
+    if not upstream_available():
+        # Claimed checks would only fail their polls and be pushed back
+        logging.warning("Sync cycle skipped: tusdatos circuit is open")
+        return {"polled": 0, "state_changed": False, "skipped": True, "elapsed": 0}
+
+    with ThreadPoolExecutor(max_workers=TUSDATOS_MAX_WORKERS) as executor:
+        while time.monotonic() - started < SYNC_MAX_CYCLE_SECONDS and upstream_available():
+            checks = claim_due_checks(SYNC_BATCH_SIZE, SYNC_LEASE_SECONDS)
+            if not checks:
+                break
+
+            updates = []
+            for check, (update, changed) in zip(checks, executor.map(poll_check, checks)):
+                failures = (check['poll_failures'] or 0) + 1 if update['poll_failed'] else 0
+                update['next_poll_in'] = next_poll_delay(check['age_seconds'], failures)
+                updates.append(update)
+                state_changed = state_changed or changed
+            update_check_states(updates)
+            polled += len(checks)
+
+            if len(checks) < SYNC_BATCH_SIZE:
+                break
+
+    if state_changed or get_outdated_results(limit=1):
+        update_pending_results()
+
+    stats = {"polled": polled, "state_changed": state_changed, "elapsed": round(time.monotonic() - started, 2)}
+    logging.info(f"Sync cycle finished: {stats}")
+    return stats
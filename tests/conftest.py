@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings are read at import time: no client rate limit, and no database is needed
+os.environ.setdefault("TUSDATOS_RATE_LIMIT", "0")
+
+import tusdatos_client
+from benchmarks.mock_tusdatos import MockState, start_mock_server
+
+@pytest.fixture
+def mock_tusdatos(monkeypatch):
+    """
+    Mock tusdatos server without latency or errors, used by the process-wide client.
+    Yields the MockState of the server.
+    """
+    state = MockState(latency_ms=0, jitter_ms=0, error_rate=0, throttle_rate=0, job_seconds=60, cached_rate=0)
+    server = start_mock_server(state)
+    client = tusdatos_client.TusDatosClient(base_url=f"http://127.0.0.1:{server.server_address[1]}/api",
+                                            max_retries=0)
+    monkeypatch.setattr(tusdatos_client, "_client", client)
+    yield state
+    client.session.close()
+    server.shutdown()
+    server.server_close()
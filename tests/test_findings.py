@@ -0,0 +1,30 @@
+import json
+
+from findings import extract_findings
+
+def test_extract_findings():
+    payload = {"dict_hallazgos": {
+        "altos": [{"fuente": " OFAC ", "descripcion": "Coincidencia en lista"}],
+        "medios": [{"entidad": "Procuraduria", "detalle": {"sanciones": 1}}],
+        "bajos": ["Registro mercantil"],
+    }}
+    findings = extract_findings(json.dumps(payload))
+    assert findings == [
+        {"severity": "alto", "source": "OFAC", "description": "Coincidencia en lista",
+         "detail": {"fuente": " OFAC ", "descripcion": "Coincidencia en lista"}},
+        {"severity": "medio", "source": "Procuraduria", "description": '{"sanciones": 1}',
+         "detail": {"entidad": "Procuraduria", "detalle": {"sanciones": 1}}},
+        {"severity": "bajo", "source": None, "description": "Registro mercantil", "detail": None},
+    ]
+
+def test_extract_findings_of_malformed_payloads():
+    assert extract_findings({}) == []
+    assert extract_findings([]) == []
+    assert extract_findings({"dict_hallazgos": None}) == []
+    assert extract_findings({"dict_hallazgos": ["altos"]}) == []
+    assert extract_findings({"dict_hallazgos": {"altos": None, "otros": [{"fuente": "x"}]}}) == []
+
+def test_extract_findings_truncates_long_fields():
+    findings = extract_findings({"dict_hallazgos": {"altos": [{"fuente": "f" * 300, "descripcion": "d" * 5000}]}})
+    assert len(findings[0]["source"]) == 255
+    assert len(findings[0]["description"]) == 2000
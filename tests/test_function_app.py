@@ -0,0 +1,23 @@
+import pytest
+
+from function_app import parse_byte_range
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=900-2000", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=999-999", (999, 999)),
+])
+def test_parse_byte_range(header, expected):
+    assert parse_byte_range(header, 1000) == expected
+
+@pytest.mark.parametrize("header", [None, "", "items=0-10", "bytes=0-10,20-30", "bytes=-", "bytes=a-b"])
+def test_parse_byte_range_sends_full_body(header):
+    assert parse_byte_range(header, 1000) is None
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1000-1200", "bytes=50-10"])
+def test_parse_byte_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_byte_range(header, 1000)
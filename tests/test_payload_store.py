@@ -0,0 +1,32 @@
+import pytest
+
+from payload_store import accepts_gzip, compress_payload, decompress_payload, load_payload
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ("gzip", True),
+    ("deflate, gzip;q=0.5", True),
+    ("GZIP;Q=1", True),
+    ("br, *", True),
+    ("deflate", False),
+    ("gzip;q=0", False),
+    ("gzip;q=0.000", False),
+    ("*;q=0", False),
+    # An explicit gzip entry decides over *
+    ("*;q=0, gzip", True),
+    ("gzip;q=0, *", False),
+])
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(header) is expected
+
+def test_payload_round_trip():
+    payload = {"dict_hallazgos": {"altos": ["ñandú"]}}
+    compressed = compress_payload(payload)
+    assert compressed[:2] == b"\x1f\x8b"
+    assert decompress_payload(compressed) == '{"dict_hallazgos": {"altos": ["ñandú"]}}'
+    assert compress_payload('{"a": 1}') == compress_payload('{"a": 1}')
+
+def test_load_payload_prefers_compressed_column():
+    assert load_payload({"response_payload": "legacy", "response_payload_gz": compress_payload("{}")}) == "{}"
+    assert load_payload({"response_payload": "legacy", "response_payload_gz": None}) == "legacy"
@@ -0,0 +1,42 @@
+import io
+import json
+import zipfile
+
+import report_export
+
+def finalized(check_id: int) -> dict:
+    return {"id": check_id, "document": f"doc/{check_id}", "typedoc": "CC", "status": "finalizado", "result_id": f"r{check_id}"}
+
+def stage(check: dict, size: int, staging) -> int:
+    staging.write(b"%" * size)
+    staging.seek(0)
+    return size
+
+def test_export_stops_fetching_once_full(monkeypatch):
+    fetched = []
+    def ensure(check):
+        fetched.append(check["id"])
+        return 40
+    monkeypatch.setattr(report_export, "_ensure_pdf", ensure)
+    monkeypatch.setattr(report_export, "_stage_pdf", stage)
+
+    checks = [finalized(i) for i in range(1, 21)] + [dict(finalized(21), status="procesando")]
+    out = io.BytesIO()
+    manifest = report_export.export_reports_zip(checks, out, requested_ids=[1, 99], max_workers=2, max_bytes=100)
+
+    assert [item["check_id"] for item in manifest["exported"]] == [1, 2]
+    assert len(fetched) <= 5
+    reasons = {item["check_id"]: item["reason"] for item in manifest["failed"]}
+    assert reasons[99] == "Check not found"
+    assert reasons[21].startswith("Check is not yet finalized")
+    assert all(reasons[i] == report_export.EXPORT_LIMIT_REASON for i in range(3, 21))
+    with zipfile.ZipFile(out) as archive:
+        assert sorted(archive.namelist()) == ["1_CC_doc_1.pdf", "2_CC_doc_2.pdf", "manifest.json"]
+        assert json.loads(archive.read("manifest.json"))["exported"] == manifest["exported"]
+
+def test_failed_reports_do_not_stop_the_export(monkeypatch):
+    monkeypatch.setattr(report_export, "_ensure_pdf", lambda check: None if check["id"] == 1 else 10)
+    monkeypatch.setattr(report_export, "_stage_pdf", stage)
+    manifest = report_export.export_reports_zip([finalized(1), finalized(2)], io.BytesIO(), max_bytes=100)
+    assert [item["check_id"] for item in manifest["exported"]] == [2]
+    assert manifest["failed"][0]["reason"] == "Could not fetch the report from the provider"
@@ -0,0 +1,148 @@
+import time
+
+import pytest
+import requests
+
+import tusdatos_client
+from models import BackgroundCheckRequest
+from tusdatos_client import CircuitBreaker, CircuitOpenError, TokenBucket, charged_checks, launch_checks
+
+def test_token_bucket_allows_bursts_then_waits():
+    bucket = TokenBucket(rate=20, capacity=2)
+    start = time.monotonic()
+    bucket.acquire()
+    bucket.acquire()
+    assert time.monotonic() - start < 0.04
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.04
+
+def test_token_bucket_without_rate_never_waits():
+    bucket = TokenBucket(rate=0, capacity=1)
+    start = time.monotonic()
+    for _ in range(100):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.1
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.snapshot()["retry_in"] > 0
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+def test_failed_trial_reopens_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=60)
+    for _ in range(5):
+        breaker.record_failure()
+    breaker.opened_at -= 60
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_trial_without_outcome_is_released(monkeypatch):
+    client = tusdatos_client.TusDatosClient(base_url="http://127.0.0.1:9", max_retries=0)
+    client.breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    client.breaker.record_failure()
+    def fail(*args, **kwargs):
+        raise TypeError("Object of type set is not JSON serializable")
+    monkeypatch.setattr(client.session, "request", fail)
+    with pytest.raises(TypeError):
+        client.get("/results/1")
+    assert not client.breaker.trial_in_flight
+    assert client.breaker.allow()
+
+def test_request_raises_while_circuit_is_open():
+    client = tusdatos_client.TusDatosClient(base_url="http://127.0.0.1:9", max_retries=0)
+    client.breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+    client.breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        client.get("/results/1")
+
+@pytest.fixture
+def stored_checks(monkeypatch):
+    """
+    Replaces the database calls of launch_checks: no recent checks by default, saved
+    records get consecutive ids. Yields the saved records.
+    """
+    saved = []
+    def save(records):
+        saved.extend(records)
+        return list(range(len(saved) - len(records) + 1, len(saved) + 1))
+    monkeypatch.setattr(tusdatos_client, "find_recent_checks", lambda user_id, keys, ttl: {})
+    monkeypatch.setattr(tusdatos_client, "save_backgroundCheck_requests", save)
+    monkeypatch.setattr(tusdatos_client, "copy_check_results", lambda pairs: None)
+    yield saved
+
+def check(doc, **kwargs) -> BackgroundCheckRequest:
+    return BackgroundCheckRequest(typedoc="CC", doc=doc, **kwargs)
+
+def test_launch_checks_launches_repeated_documents_once(mock_tusdatos, stored_checks):
+    results = launch_checks(1, [check("100"), check("200"), check("100"), check("100", force=True)], dedupe_ttl=60)
+    assert mock_tusdatos.calls["launch"] == 3
+    assert [r["doc"] for r in results] == ["100", "200", "100", "100"]
+    assert [r["status"] for r in results] == ["procesando"] * 4
+    assert [r["deduplicated"] for r in results] == [False, False, True, False]
+    assert stored_checks[2]["jobid"] == stored_checks[0]["jobid"]
+    assert charged_checks(results) == 3
+
+def test_launch_checks_reuses_recent_checks(mock_tusdatos, stored_checks, monkeypatch):
+    recent = {"id": 7, "jobid": "job-7", "result_id": "res-7"}
+    monkeypatch.setattr(tusdatos_client, "find_recent_checks",
+                        lambda user_id, keys, ttl: {("CC", "100"): recent})
+    copied = []
+    monkeypatch.setattr(tusdatos_client, "copy_check_results", copied.extend)
+    results = launch_checks(1, [check("100"), check("200")], dedupe_ttl=60)
+    assert mock_tusdatos.calls["launch"] == 1
+    assert results[0]["status"] == "finalizado" and results[0]["deduplicated"]
+    assert stored_checks[0]["result_id"] == "res-7"
+    assert copied == [(7, results[0]["id"])]
+    assert charged_checks(results) == 1
+
+def test_launch_checks_without_dedupe(mock_tusdatos, stored_checks):
+    results = launch_checks(1, [check("100"), check("100")], dedupe_ttl=0)
+    assert mock_tusdatos.calls["launch"] == 2
+    assert charged_checks(results) == 2
+
+def test_launch_checks_not_sent_while_circuit_is_open(mock_tusdatos, stored_checks):
+    breaker = tusdatos_client.get_client().breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    results = launch_checks(1, [check("100"), check("100")], dedupe_ttl=60)
+    assert "launch" not in mock_tusdatos.calls
+    assert [r["not_sent"] for r in results] == [True, True]
+    assert stored_checks == []
+    assert charged_checks(results) == 0
+
+def test_launch_checks_upstream_errors_are_not_charged(mock_tusdatos, stored_checks):
+    mock_tusdatos.error_rate = 1
+    results = launch_checks(1, [check("100")], dedupe_ttl=0)
+    assert results[0]["status"] == "error" and not results[0]["not_sent"]
+    assert charged_checks(results) == 0
+
+def test_charged_checks():
+    results = [
+        {"id": 1, "status": "procesando", "deduplicated": False},
+        {"id": 2, "status": "finalizado", "deduplicated": True},
+        {"id": 3, "status": "error", "deduplicated": False},
+        {"id": None, "status": "error", "deduplicated": False},
+    ]
+    assert charged_checks(results) == 1
+
+def test_connect_timeouts_are_not_sent():
+    assert issubclass(requests.ConnectTimeout, tusdatos_client.NOT_SENT_ERRORS)
@@ -0,0 +1,73 @@
+from user_cache import CacheBackend, UserCache
+
+class DictBackend(CacheBackend):
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key: str) -> str:
+        return self.values.get(key)
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        self.values[key] = value
+
+    def delete(self, key: str):
+        self.values.pop(key, None)
+
+def test_get_or_load_caches_until_invalidated():
+    cache = UserCache()
+    loads = []
+    def load():
+        loads.append(1)
+        return {"id": 1, "credits": len(loads)}
+    assert cache.get_or_load(1, load) == {"id": 1, "credits": 1}
+    assert cache.get_or_load(1, load) == {"id": 1, "credits": 1}
+    cache.invalidate(1)
+    assert cache.get(1) is None
+    assert cache.get_or_load(1, load) == {"id": 1, "credits": 2}
+    assert len(loads) == 2
+
+def test_none_is_not_cached():
+    cache = UserCache()
+    assert cache.get_or_load(1, lambda: None) is None
+    assert cache.get(1) is None
+
+def test_load_raced_by_invalidate_is_not_cached():
+    backend = DictBackend()
+    cache = UserCache(backend=backend)
+    def load():
+        cache.invalidate(1)
+        return {"id": 1, "credits": 0}
+    assert cache.get_or_load(1, load) == {"id": 1, "credits": 0}
+    assert cache.get(1) is None
+    assert backend.values == {}
+
+def test_load_raced_by_pruned_invalidate_is_not_cached():
+    cache = UserCache(max_entries=2)
+    def load():
+        for user_id in (1, 2, 3, 4):
+            cache.invalidate(user_id)
+        return {"id": 1}
+    cache.get_or_load(1, load)
+    assert cache.get(1) is None
+    assert len(cache._generations) == 2
+
+def test_entries_are_bounded_lru():
+    cache = UserCache(max_entries=2)
+    for user_id in (1, 2):
+        cache.get_or_load(user_id, lambda: {"id": user_id})
+    cache.get(1)
+    cache.get_or_load(3, lambda: {"id": 3})
+    assert cache.get(1) == {"id": 1}
+    assert cache.get(2) is None
+    assert cache.get(3) == {"id": 3}
+
+def test_expired_entries_are_reloaded():
+    cache = UserCache(ttl_seconds=0)
+    cache.get_or_load(1, lambda: {"id": 1})
+    assert cache.get(1) is None
+
+def test_shared_tier_is_read_through():
+    backend = DictBackend()
+    UserCache(backend=backend).get_or_load(1, lambda: {"id": 1, "credits": 5})
+    other_worker = UserCache(backend=backend)
+    assert other_worker.get_or_load(1, lambda: None) == {"id": 1, "credits": 5}
@@ -1,10 +1,16 @@
 import requests
+from requests.adapters import HTTPAdapter
 import base64
+import threading
+import random
+import time
 import os
 from models import BackgroundCheckRequest, BackgroundCheckResponse, CheckStatusResponse
-from db_operations import * #get_pending_checks, update_check_status, get_check, save_backgroundCheck_result
+from db_operations import (save_backgroundCheck_requests, save_backgroundCheck_results, find_recent_checks,
+                           copy_check_results, get_outdated_checks, record_result_fetch_failures)
 import logging
 import json
+from concurrent.futures import ThreadPoolExecutor
 logging.basicConfig(level=logging.INFO)
 
 # from dotenv import load_dotenv
@@ -17,14 +23,258 @@ TUSDATOS_API_PASSWORD = os.environ.get("TUSDATOS_API_PASSWORD", "password")
 
 VALID_DOC_TYPES = {'CC', 'CE', 'INT', 'NIT', 'PP', 'PPT', 'NOMBRE'}
 
+# Maximum number of concurrent requests in flight against the tusdatos API
+TUSDATOS_MAX_WORKERS = int(os.environ.get("TUSDATOS_MAX_WORKERS", 8))
+# Number of finalized checks whose results are fetched and stored together
+RESULTS_CHUNK_SIZE = int(os.environ.get("RESULTS_CHUNK_SIZE", 20))
+# Delay before fetching again the results of a check after its first failed fetch, doubled on
+# each further failure up to RESULTS_RETRY_MAX_SECONDS
+RESULTS_RETRY_BASE_SECONDS = float(os.environ.get("RESULTS_RETRY_BASE_SECONDS", 60))
+RESULTS_RETRY_MAX_SECONDS = float(os.environ.get("RESULTS_RETRY_MAX_SECONDS", 6 * 3600))
+# Finalized checks of the same user and document newer than this are reused instead of
+# launching a new job (0 disables deduplication)
+LAUNCH_DEDUPE_TTL_SECONDS = float(os.environ.get("LAUNCH_DEDUPE_TTL_SECONDS", 0))
+# Size of the chunks read from streamed report downloads
+REPORT_CHUNK_SIZE = int(os.environ.get("REPORT_CHUNK_SIZE", 64 * 1024))
+# Keep-alive connections kept open by the shared session
+TUSDATOS_POOL_MAXSIZE = int(os.environ.get("TUSDATOS_POOL_MAXSIZE", 16))
+TUSDATOS_CONNECT_TIMEOUT = float(os.environ.get("TUSDATOS_CONNECT_TIMEOUT", 5))
+TUSDATOS_READ_TIMEOUT = float(os.environ.get("TUSDATOS_READ_TIMEOUT", 60))
+# Client-side rate limit shared by every call of the process (0 disables it)
+TUSDATOS_RATE_LIMIT = float(os.environ.get("TUSDATOS_RATE_LIMIT", 10))
+TUSDATOS_RATE_BURST = int(os.environ.get("TUSDATOS_RATE_BURST", 10))
+# Retries of throttled (429), failed (5xx) and unreachable calls, with exponential backoff and jitter
+TUSDATOS_MAX_RETRIES = int(os.environ.get("TUSDATOS_MAX_RETRIES", 3))
+TUSDATOS_BACKOFF_BASE = float(os.environ.get("TUSDATOS_BACKOFF_BASE", 0.5))
+TUSDATOS_BACKOFF_MAX = float(os.environ.get("TUSDATOS_BACKOFF_MAX", 10))
+# Consecutive failed calls that open the circuit, and how long it stays open before a trial call
+TUSDATOS_BREAKER_FAILURES = int(os.environ.get("TUSDATOS_BREAKER_FAILURES", 5))
+TUSDATOS_BREAKER_RESET_SECONDS = float(os.environ.get("TUSDATOS_BREAKER_RESET_SECONDS", 30))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Non-idempotent calls (POST /launch) are only retried when the upstream did not process them
+REJECTED_STATUS_CODES = {429, 503}
+
 # Helper function to get headers
 def get_headers():
-    logging.info(f"Using TUSDATOS_API_BASE_URL: {TUSDATOS_API_BASE_URL}")
-    logging.info(f"Using TUSDATOS_API_USERNAME: {TUSDATOS_API_USERNAME}")
     auth_str = f"{TUSDATOS_API_USERNAME}:{TUSDATOS_API_PASSWORD}"
     base64_auth = base64.b64encode(auth_str.encode('ascii')).decode('ascii')
     return {"Authorization": f"Basic {base64_auth}", "Content-Type": "application/json"}
 
+class CircuitOpenError(requests.RequestException):
+    """
+    Raised instead of calling tusdatos while the circuit breaker is open.
+    """
+
+# Launch failures that never reached tusdatos, so the check can be launched again later
+NOT_SENT_ERRORS = (CircuitOpenError, requests.ConnectTimeout)
+# Returned by launch_check for those failures
+NOT_SENT = object()
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, up to `capacity` stored for bursts.
+    """
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, sleeping until one is available.
+        """
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class CircuitBreaker:
+    """
+    Circuit breaker over consecutive failures. `closed` lets every call through, `open`
+    rejects calls for reset_seconds, then `half_open` lets a single trial call through
+    whose outcome closes or re-opens the circuit.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        with self.lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    logging.warning(f"tusdatos circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """
+        Give up a call that ended without an outcome (neither a response nor a request
+        error), so that a half-open circuit lets another trial call through.
+        """
+        with self.lock:
+            self.trial_in_flight = False
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            state = self._state()
+            retry_in = None
+            if state == self.OPEN:
+                retry_in = round(self.reset_seconds - (time.monotonic() - self.opened_at), 1)
+            return {"state": state, "consecutive_failures": self.failures, "retry_in": retry_in}
+
+def backoff_delay(attempt: int, response: requests.Response = None) -> float:
+    """
+    Delay before retry number `attempt` (0-based): the Retry-After of a throttled response
+    when given, exponential backoff with full jitter otherwise.
+    """
+    if response is not None and response.headers.get("Retry-After", "").isdigit():
+        return min(float(response.headers["Retry-After"]), TUSDATOS_BACKOFF_MAX)
+    return random.uniform(0, min(TUSDATOS_BACKOFF_MAX, TUSDATOS_BACKOFF_BASE * 2 ** attempt))
+
+class TusDatosClient:
+    """
+    Long-lived tusdatos API client sharing one pooled keep-alive session.
+    The auth headers are built once when the client is created. Every call goes through
+    the rate limiter and the circuit breaker, and is retried with backoff when throttled
+    or failing.
+    """
+    def __init__(self, base_url: str = TUSDATOS_API_BASE_URL, pool_maxsize: int = TUSDATOS_POOL_MAXSIZE,
+                 timeout: tuple = (TUSDATOS_CONNECT_TIMEOUT, TUSDATOS_READ_TIMEOUT),
+                 max_retries: int = TUSDATOS_MAX_RETRIES):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.rate_limiter = TokenBucket(TUSDATOS_RATE_LIMIT, TUSDATOS_RATE_BURST)
+        self.breaker = CircuitBreaker(TUSDATOS_BREAKER_FAILURES, TUSDATOS_BREAKER_RESET_SECONDS)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(get_headers())
+        logging.info(f"Using TUSDATOS_API_BASE_URL: {base_url}")
+        logging.info(f"Using TUSDATOS_API_USERNAME: {TUSDATOS_API_USERNAME}")
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Send a request, returning the last response once retries are exhausted.
+        Raises CircuitOpenError while the circuit is open.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        idempotent = method.upper() in ("GET", "HEAD", "OPTIONS")
+        retry_codes = RETRY_STATUS_CODES if idempotent else REJECTED_STATUS_CODES
+        retry_errors = (requests.ConnectionError, requests.Timeout) if idempotent else (requests.ConnectTimeout,)
+
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"tusdatos circuit is open, not calling {method} {path}")
+            response = None
+            recorded = False
+            try:
+                self.rate_limiter.acquire()
+                try:
+                    response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+                except requests.RequestException as e:
+                    self.breaker.record_failure()
+                    recorded = True
+                    if not isinstance(e, retry_errors) or attempt == self.max_retries:
+                        raise
+                    logging.warning(f"tusdatos {method} {path} failed ({e}), retry {attempt + 1}/{self.max_retries}")
+                else:
+                    recorded = True
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        self.breaker.record_success()
+                        return response
+                    self.breaker.record_failure()
+                    if response.status_code not in retry_codes or attempt == self.max_retries:
+                        return response
+                    logging.warning(f"tusdatos {method} {path} returned {response.status_code}, retry {attempt + 1}/{self.max_retries}")
+                    response.close()
+            finally:
+                # Any other exception (e.g. from a hook) must not leave a half-open trial in flight forever
+                if not recorded:
+                    self.breaker.release_trial()
+            time.sleep(backoff_delay(attempt, response))
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+_client: TusDatosClient = None
+_client_lock = threading.Lock()
+
+def get_client() -> TusDatosClient:
+    """
+    Return the process-wide tusdatos client, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TusDatosClient()
+    return _client
+
+def circuit_state() -> dict:
+    """
+    Return the state of the tusdatos circuit breaker (closed, open or half_open).
+    """
+    return get_client().breaker.snapshot()
+
+def upstream_available() -> bool:
+    """
+    Whether calls to tusdatos are currently let through (circuit closed or half-open).
+    """
+    return circuit_state()["state"] != CircuitBreaker.OPEN
+
 def launch_verify(request_data: BackgroundCheckRequest) -> BackgroundCheckResponse:
     """
     Function to launch a background check request.
@@ -33,7 +283,7 @@ def launch_verify(request_data: BackgroundCheckRequest) -> BackgroundCheckRespon
         return 400, f"Invalid document type: {request_data.typedoc}. Must be one of {VALID_DOC_TYPES}."
     
     payload = request_data.model_dump(exclude_none=True)
-    response = requests.post(f"{TUSDATOS_API_BASE_URL}/launch", headers=get_headers(), json=payload)
+    response = get_client().post("/launch", json=payload)
     
     if response.status_code == 200:
     
@@ -71,131 +321,343 @@ def launch_verify(request_data: BackgroundCheckRequest) -> BackgroundCheckRespon
 
     return response.status_code, response_dict
 
+def launch_check(user_id: int, request_data: BackgroundCheckRequest) -> dict:
+    """
+    Function to launch a single background check and build its request record.
+    Returns None if the check could not be launched, NOT_SENT if the launch never reached tusdatos.
+    """
+    try:
+        status_code, response_dict = launch_verify(request_data)
+        logging.info(f"Background check launched for document {request_data.doc} with status code {status_code}. Respose dict {response_dict}")
+
+        return {
+            "userid": user_id,
+            "document": request_data.doc,
+            "typedoc": request_data.typedoc,
+            "payload": request_data.model_dump(),
+            "jobid": response_dict['jobid'],
+            "status": response_dict['status'],
+            "response_code": status_code,
+            "response_content": response_dict['response_data'],
+            "result_id": response_dict['id'] if status_code == 200 else None
+        }
+    except NOT_SENT_ERRORS as e:
+        logging.warning(f"Background check for document {request_data.doc} was not sent to tusdatos: {e}")
+        return NOT_SENT
+    except Exception as e:
+        logging.error(f"Error launching background check for document {request_data.doc}: {e}")
+        return None
+
+def dedupe_key(request_data: BackgroundCheckRequest) -> tuple:
+    return (request_data.typedoc, str(request_data.doc))
+
+def reused_check_record(user_id: int, request_data: BackgroundCheckRequest, recent_check: dict) -> dict:
+    """
+    Function to build the request record of a check answered by a recent check of the same document.
+    """
+    return {
+        "userid": user_id,
+        "document": request_data.doc,
+        "typedoc": request_data.typedoc,
+        "payload": request_data.model_dump(),
+        "jobid": recent_check['jobid'],
+        "status": 'finalizado',
+        "response_code": 200,
+        "response_content": json.dumps({"reused_check_id": recent_check['id']}),
+        "result_id": recent_check['result_id']
+    }
+
+def launch_checks(user_id: int, checks: list, max_workers: int = None, dedupe_ttl: float = None,
+                  batch_id: str = None, batch_positions: list = None) -> list:
+    """
+    Function to launch a list of background checks concurrently and store them in one batch.
+    When deduplication is enabled (dedupe_ttl > 0, LAUNCH_DEDUPE_TTL_SECONDS by default), repeated
+    documents in the batch are launched once, and documents with a finalized check of the user
+    newer than dedupe_ttl seconds reuse its result instead of launching a new job. Checks with
+    force set are always launched.
+    Results are returned in the same order as the input checks; `deduplicated` marks the
+    checks that did not launch an upstream job, `not_sent` the failed checks whose launch
+    never reached tusdatos (circuit open or connection timeout) and can be retried.
+    Checks launched from a batch pass its batch_id and the position of each check's item,
+    which are stored with the checks.
+    """
+    if not checks:
+        return []
+    max_workers = max_workers or TUSDATOS_MAX_WORKERS
+    dedupe_ttl = LAUNCH_DEDUPE_TTL_SECONDS if dedupe_ttl is None else dedupe_ttl
+
+    # Index of the earlier check of the batch whose launch a duplicate shares
+    duplicate_of = {}
+    # Recent finalized check reused by a check of the batch
+    reused = {}
+    if dedupe_ttl > 0:
+        first_by_key = {}
+        for i, request_data in enumerate(checks):
+            if request_data.force:
+                continue
+            key = dedupe_key(request_data)
+            if key in first_by_key:
+                duplicate_of[i] = first_by_key[key]
+            else:
+                first_by_key[key] = i
+        recent_checks = find_recent_checks(user_id, list(first_by_key), dedupe_ttl)
+        for key, i in first_by_key.items():
+            if key in recent_checks:
+                reused[i] = recent_checks[key]
+        logging.info(f"Deduplicated {len(duplicate_of)} repeated and {len(reused)} recent checks for user {user_id}")
+
+    to_launch = [i for i in range(len(checks)) if i not in duplicate_of and i not in reused]
+    launched = {}
+    if to_launch:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(to_launch))) as executor:
+            launched = dict(zip(to_launch, executor.map(lambda i: launch_check(user_id, checks[i]), to_launch)))
+    not_sent = {i for i, record in launched.items() if record is NOT_SENT}
+    not_sent.update(i for i, source in duplicate_of.items() if source in not_sent)
+
+    records = []
+    for i, request_data in enumerate(checks):
+        if i in reused:
+            record = reused_check_record(user_id, request_data, reused[i])
+        elif i in duplicate_of:
+            source = records[duplicate_of[i]]
+            record = dict(source, payload=request_data.model_dump()) if source is not None else None
+        else:
+            record = launched[i] if i not in not_sent else None
+        records.append(record)
+    if batch_id is not None:
+        records = [dict(record, batch_id=batch_id, batch_position=position) if record is not None else None
+                   for record, position in zip(records, batch_positions)]
+
+    request_ids = iter(save_backgroundCheck_requests([r for r in records if r is not None]))
+
+    results = []
+    copied_results = []
+    for i, (request_data, record) in enumerate(zip(checks, records)):
+        deduplicated = i in reused or i in duplicate_of
+        if i in not_sent:
+            results.append({'id': None, 'doc': request_data.doc, 'status': 'error', 'response': 'Background check provider is unavailable', 'deduplicated': deduplicated, 'not_sent': True})
+            continue
+        if record is None:
+            results.append({'id': None, 'doc': request_data.doc, 'status': 'error', 'response': 'Failed to launch background check', 'deduplicated': deduplicated, 'not_sent': False})
+            continue
+        request_id = next(request_ids)
+        if request_id is None:
+            results.append({'id': None, 'doc': request_data.doc, 'status': 'error', 'response': 'Failed to save background check', 'deduplicated': deduplicated, 'not_sent': False})
+            continue
+        source = reused.get(i) or reused.get(duplicate_of.get(i))
+        if source is not None:
+            copied_results.append((source['id'], request_id))
+        results.append({'id': request_id, 'doc': request_data.doc, 'status': record['status'], 'response': record['response_content'], 'deduplicated': deduplicated, 'not_sent': False})
+
+    # Reused checks get a copy of the stored results, those not stored yet are fetched by the sync worker
+    copy_check_results(copied_results)
+    return results
+
+def charged_checks(results: list) -> int:
+    """
+    Function to count the checks of a launch_checks result that consumed a credit.
+    """
+    return sum(1 for r in results if r['id'] is not None and r['status'] != 'error' and not r['deduplicated'])
+
 def get_job_status(job_id) -> str:
     """
     Function to get the status of a job using its job ID.
     """
-    # Assuming TUSDATOS_API_BASE_URL and get_headers() are defined elsewhere
     # mocked_jobid = "6460fc34-4154-43db-9438-8c5a059304c0"
-    response = requests.get(f"{TUSDATOS_API_BASE_URL}/results/{job_id}", headers=get_headers())
+    response = get_client().get(f"/results/{job_id}")
     
     if response.status_code == 200:
         status_data = response.json()
         # status_model = CheckStatusResponse(**status_data)
         return status_data
+    elif response.status_code in RETRY_STATUS_CODES:
+        # Throttled or failing upstream, the job state is unknown
+        response.raise_for_status()
     else:
         return response.json()
 
-def sync_pending_checks(user_id=None):
+def poll_check(check: dict) -> tuple:
     """
-    Function to sync the check status of a user.
+    Function to fetch the upstream status of a pending check.
+    Returns the state update to apply and whether the check changed state.
     """
-    checks_list = get_pending_checks(user_id)
-    if not checks_list:
-        return {"message": "No pending checks found."}
-    
-    _state_changed = False
-    for check in checks_list:
-        check_id = check['id']
-        job_id = check['jobid']
-        c_state = check['status']
-        # Assuming TUSDATOS_API_BASE_URL and get_headers() are defined elsewhere
-        max_retries = 3
-        retry_count = 0
-        status_data = None
-
-        while retry_count < max_retries:
-            status_data = get_job_status(job_id)
-            if status_data is not None:
-                break
-            retry_count += 1
-            logging.warning(f"Retry {retry_count}/{max_retries} for check_id {check_id} with job_id {job_id}")
-        
-        if status_data is None:
-            error_text = f"Failed to fetch status for check_id {check_id} with job_id {job_id} after {max_retries} retries."
-            update_status_response(check_id, error_text)
-            update_check_status(check_id, 'procesando')
-            logging.error(error_text)
-            continue
+    check_id = check['id']
+    job_id = check['jobid']
+    c_state = check['status']
 
-        update_status_response(check_id, json.dumps(status_data))
+    # Retries with backoff happen in the client, a failure here is final for this poll
+    try:
+        status_data = get_job_status(job_id)
+    except (requests.RequestException, ValueError) as e:
+        error_text = f"Failed to fetch status for check_id {check_id} with job_id {job_id}: {e}"
+        logging.error(error_text)
+        return {'id': check_id, 'status': 'procesando', 'status_response': error_text, 'result_id': None, 'poll_failed': True}, False
 
-        try:
-            if status_data['estado'] == 'finalizado':
-                update_check_result_id(check_id, status_data['id'])
-
-            if status_data['estado'] != c_state:
-                update_check_status(check_id, status_data['estado'])
-                _state_changed = True
-        except KeyError as e:
-            logging.error(f"KeyError for check_id {check_id} with job_id {job_id}: {e}")
-            update_check_status(check_id, 'error')
-            continue
-    return _state_changed
+    update = {'id': check_id, 'status': c_state, 'status_response': json.dumps(status_data), 'result_id': None, 'poll_failed': False}
+    try:
+        if status_data['estado'] == 'finalizado':
+            update['result_id'] = status_data['id']
+        update['status'] = status_data['estado']
+    except KeyError as e:
+        logging.error(f"KeyError for check_id {check_id} with job_id {job_id}: {e}")
+        update['status'] = 'error'
+        return update, False
+    return update, update['status'] != c_state
 
 def launch_check_results(job_id):
     """
     Function to get the results of a check using its check ID.
     """
 
-    # Assuming TUSDATOS_API_BASE_URL and get_headers() are defined elsewhere
     try:
-        response = requests.get(f"{TUSDATOS_API_BASE_URL}/report_json/{job_id}", headers=get_headers())
+        response = get_client().get(f"/report_json/{job_id}")
         response.raise_for_status()
         return response
     except requests.RequestException as e:
         logging.error(f"Error fetching check results for job_id {job_id}: {e}")
         return None
     
-def launch_report_pdf(result_id, type_doc):
+def launch_report_pdf(result_id, type_doc, stream: bool = False):
     """
     Function to get the PDF report of a check using its result ID.
+    With stream=True the body is not downloaded until it is iterated, see iter_report_chunks.
     """
 
-    # Assuming TUSDATOS_API_BASE_URL and get_headers() are defined elsewhere
     try:
         if type_doc.lower() == 'nit' :
             report_endpoint = 'report_nit_pdf'
         else:
             report_endpoint = 'report_pdf'
 
-        response = requests.get(f"{TUSDATOS_API_BASE_URL}/v2/{report_endpoint}/{result_id}", headers=get_headers())
+        response = get_client().get(f"/v2/{report_endpoint}/{result_id}", stream=stream)
+        if not response.ok:
+            response.close()
         response.raise_for_status()
         return response  # Return raw PDF bytes
     except requests.RequestException as e:
         logging.error(f"Error fetching PDF report for result_id {result_id}: {e}")
         return None
     
-def launch_report_html(result_id):
+def launch_report_html(result_id, stream: bool = False):
     """
     Function to get the HTML report of a check using its result ID.
+    With stream=True the body is not downloaded until it is iterated, see iter_report_chunks.
     """
 
-    # Assuming TUSDATOS_API_BASE_URL and get_headers() are defined elsewhere
     try:
-        response = requests.get(f"{TUSDATOS_API_BASE_URL}/v2/report/{result_id}", headers=get_headers())
+        response = get_client().get(f"/v2/report/{result_id}", stream=stream)
+        if not response.ok:
+            response.close()
         response.raise_for_status()
         return response  # Return raw HTML bytes
     except requests.RequestException as e:
         logging.error(f"Error fetching HTML report for result_id {result_id}: {e}")
         return None
 
-def update_pending_results(user_id: int = None):    
-    check_ids = get_outdated_results(user_id)
+def iter_report_chunks(response, chunk_size: int = None):
+    """
+    Function to iterate over the body of a streamed report response in chunks,
+    releasing the connection once the body is consumed.
+    Returns None if the response is None.
+    """
+    if response is None:
+        return None
+    chunk_size = chunk_size or REPORT_CHUNK_SIZE
 
-    for check_id in check_ids:
-        check = get_check(check_id)
+    def chunks():
+        with response:
+            yield from response.iter_content(chunk_size=chunk_size)
+    return chunks()
 
-        job_id = check['result_id']   
+def fetch_check_result(check: dict) -> dict:
+    """
+    Function to download the results of a finalized check and count its hallazgos.
+    Returns None if the results could not be fetched or the payload is malformed.
+    """
+    results_response = launch_check_results(check['result_id'])
+    if results_response is None:
+        return None
+    try:
+        results_data = results_response.json()
+        if not isinstance(results_data, dict):
+            raise ValueError(f"expected a JSON object, got {type(results_data).__name__}")
+        dict_hallazgos = results_data.get('dict_hallazgos') or {}
+        if not isinstance(dict_hallazgos, dict):
+            raise ValueError(f"expected dict_hallazgos to be an object, got {type(dict_hallazgos).__name__}")
+        return {
+            "check_id": check['id'],
+            "document": check['document'],
+            "jobid": check['jobid'],
+            "hallazgos_altos": len(dict_hallazgos.get('altos') or []),
+            "hallazgos_medios": len(dict_hallazgos.get('medios') or []),
+            "hallazgos_bajos": len(dict_hallazgos.get('bajos') or []),
+            "response_payload": results_data
+        }
+    except Exception as e:
+        # One bad payload must not abort the other checks of the run
+        logging.error(f"Invalid results payload for check_id {check['id']}: {e}")
+        return None
 
-        results_response = launch_check_results(job_id) #get_check_results(check_id)
+def save_check_results(results: list) -> tuple:
+    """
+    Function to store a chunk of results, retrying them one by one when the chunk insert fails.
+    Results that still cannot be stored are logged and skipped.
+    Returns the number of stored results and the check ids of the results that could not be stored.
+    """
+    try:
+        return save_backgroundCheck_results(results), []
+    except Exception as e:
+        logging.error(f"Could not store a chunk of {len(results)} results, storing them one by one: {e}")
 
-        results_data = results_response.json()
-        # Save data to db
-        save_backgroundCheck_result(check_id, 
-                                doc=check['document'],
-                                hallazgos_altos=len(results_data['dict_hallazgos']['altos']) if 'dict_hallazgos' in results_data else 0,
-                                hallazgos_medios=len(results_data['dict_hallazgos']['medios']) if 'dict_hallazgos' in results_data else 0,
-                                hallazgos_bajos=len(results_data['dict_hallazgos']['bajos']) if 'dict_hallazgos' in results_data else 0,
-                                response_payload=results_data)
-    return results_data
\ No newline at end of file
+    saved = 0
+    failed = []
+    for result in results:
+        try:
+            saved += save_backgroundCheck_results([result])
+        except Exception as e:
+            logging.error(f"Could not store the results of check_id {result['check_id']}: {e}")
+            failed.append(result['check_id'])
+    return saved, failed
+
+def next_fetch_delay(failures: int) -> float:
+    """
+    Seconds to wait before fetching again the results of a check that failed `failures` times in a row.
+    """
+    return min(RESULTS_RETRY_BASE_SECONDS * 2 ** min(failures - 1, 20), RESULTS_RETRY_MAX_SECONDS)
+
+def update_pending_results(user_id: int = None, chunk_size: int = None, max_workers: int = None) -> int:
+    """
+    Function to fetch and store the results of every finalized check that has none yet.
+    Results are fetched concurrently and stored with one insert per chunk; checks whose
+    results cannot be fetched or stored (including finalized checks without a result id)
+    are skipped and retried later with exponential backoff.
+    Returns the number of stored results.
+    """
+    chunk_size = chunk_size or RESULTS_CHUNK_SIZE
+    max_workers = max_workers or TUSDATOS_MAX_WORKERS
+    saved = 0
+    after_id = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            chunk = get_outdated_checks(user_id, limit=chunk_size, after_id=after_id)
+            if not chunk:
+                break
+            after_id = chunk[-1]['id']
+
+            checks = [check for check in chunk if check['result_id']]
+            results = [r for r in executor.map(fetch_check_result, checks) if r is not None]
+            if len(results) < len(chunk):
+                logging.warning(f"Could not fetch results for {len(chunk) - len(results)} of {len(chunk)} checks")
+            chunk_saved, failed = save_check_results(results)
+            saved += chunk_saved
+
+            fetched = {r['check_id'] for r in results}.difference(failed)
+            record_result_fetch_failures([
+                (check['id'], next_fetch_delay((check['result_fetch_failures'] or 0) + 1))
+                for check in chunk if check['id'] not in fetched
+            ])
+
+            if len(chunk) < chunk_size:
+                break
+    return saved
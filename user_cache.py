@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+# User records are read on every dashboard poll; credit changes invalidate them explicitly,
+# the TTL bounds how stale another worker's in-process copy can be
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", 5))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", 10000))
+# Optional shared tier, e.g. redis://host:6379/0 (requires the redis package)
+USER_CACHE_REDIS_URL = os.environ.get("USER_CACHE_REDIS_URL")
+
+class CacheBackend(ABC):
+    """
+    Interface of a shared cache tier. Values are JSON strings.
+    """
+    @abstractmethod
+    def get(self, key: str) -> str:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl_seconds: float):
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+class RedisBackend(CacheBackend):
+    def __init__(self, url: str):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, key: str) -> str:
+        value = self.client.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        self.client.set(key, value, px=max(int(ttl_seconds * 1000), 1))
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+class UserCache:
+    """
+    Read-through TTL cache of user records: a bounded in-process LRU tier in front of
+    an optional shared backend. Errors of the shared tier are logged and treated as misses.
+    """
+    def __init__(self, ttl_seconds: float = USER_CACHE_TTL_SECONDS, max_entries: int = USER_CACHE_MAX_ENTRIES,
+                 backend: CacheBackend = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries = OrderedDict()
+        # Set by invalidate from a process-wide counter, so a load that started before it is
+        # not cached. Bounded like the entries: the oldest generations are dropped and the
+        # floor keeps the highest dropped one, which keys without a generation fall back to
+        self._generations = OrderedDict()
+        self._generation_counter = 0
+        self._generation_floor = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_id) -> str:
+        return f"sampink:user:{int(user_id)}"
+
+    def get(self, user_id) -> dict:
+        key = self._key(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return dict(value)
+                del self._entries[key]
+        if self.backend is not None:
+            try:
+                value = self.backend.get(key)
+            except Exception as e:
+                logging.warning(f"Shared user cache read failed: {e}")
+                return None
+            if value is not None:
+                value = json.loads(value)
+                self._local_put(key, value)
+                return dict(value)
+        return None
+
+    def _put(self, key: str, value: dict, generation: int = None) -> bool:
+        """
+        Store a value in both tiers. With a generation, nothing is stored if the key was
+        invalidated since that generation was read. Returns False when the value was discarded.
+        """
+        if not self._local_put(key, value, generation):
+            return False
+        if self.backend is not None:
+            try:
+                self.backend.set(key, json.dumps(value), self.ttl_seconds)
+                if generation is not None and self._generation(key) != generation:
+                    # Invalidated while writing, do not leave the stale value in the shared tier
+                    self.backend.delete(key)
+                    return False
+            except Exception as e:
+                logging.warning(f"Shared user cache write failed: {e}")
+        return True
+
+    def _generation(self, key: str) -> int:
+        with self._lock:
+            return self._generations.get(key, self._generation_floor)
+
+    def _local_put(self, key: str, value: dict, generation: int = None) -> bool:
+        with self._lock:
+            if generation is not None and self._generations.get(key, self._generation_floor) != generation:
+                return False
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def invalidate(self, user_id):
+        key = self._key(user_id)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generation_counter += 1
+            self._generations[key] = self._generation_counter
+            self._generations.move_to_end(key)
+            while len(self._generations) > self.max_entries:
+                _, dropped = self._generations.popitem(last=False)
+                self._generation_floor = max(self._generation_floor, dropped)
+        if self.backend is not None:
+            try:
+                self.backend.delete(key)
+            except Exception as e:
+                logging.warning(f"Shared user cache invalidation failed: {e}")
+
+    def get_or_load(self, user_id, load) -> dict:
+        """
+        Return the cached record of `user_id`, calling `load()` on a miss.
+        Nothing is cached when `load()` returns None, or when the user is invalidated
+        while loading (the loaded record may predate the change).
+        """
+        key = self._key(user_id)
+        generation = self._generation(key)
+        value = self.get(user_id)
+        if value is None:
+            value = load()
+            if value is not None:
+                self._put(key, value, generation)
+        return value
+
+_cache: UserCache = None
+_cache_lock = threading.Lock()
+
+def get_user_cache() -> UserCache:
+    """
+    Return the process-wide user cache, creating it on first use with the
+    Redis shared tier when USER_CACHE_REDIS_URL is set.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend = None
+                if USER_CACHE_REDIS_URL:
+                    try:
+                        backend = RedisBackend(USER_CACHE_REDIS_URL)
+                    except ImportError:
+                        logging.warning("USER_CACHE_REDIS_URL is set but redis is not installed, using the in-process cache only")
+                _cache = UserCache(backend=backend)
+    return _cache